@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,7 +48,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'store.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'store.routers.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -92,15 +95,51 @@ DATABASES = {
         'PASSWORD': '',
         'HOST': '127.0.0.1',
         'PORT': '5432',
-    }
+    },
 }
 
+# True makes writes to other users' books 404 from a WHERE owner_id filter, instead of fetching the book to
+# answer 403.
+STORE_OWNER_SCOPED_WRITES = False
+
+# Per-request query count, DB/render time and size go to the 'store.metrics' logger (INFO) and a Server-Timing
+# header; a statement repeated STORE_METRICS_N_PLUS_ONE_THRESHOLD times in a request is logged as N+1 (WARNING).
+STORE_REQUEST_METRICS = True
+STORE_METRICS_N_PLUS_ONE_THRESHOLD = 5
+
+# Columnar catalog snapshot written by the snapshot_books command (requires numpy), point it at a data directory
+# in deployments. Incremental updates re-read books stamped up to STORE_SNAPSHOT_OVERLAP_SECONDS before the last
+# snapshot; edits committed later than that after their updated_at need snapshot_books --full.
+STORE_SNAPSHOT_PATH = BASE_DIR / 'books.snapshot'
+STORE_SNAPSHOT_OVERLAP_SECONDS = 60
+
+# Add read replicas of 'default' to DATABASES and list their aliases in STORE_DATABASE_REPLICAS. BOOKS_DB_REPLICA_HOST
+# adds one at that host; tests read it as 'default', the replication is not theirs to check.
+DATABASE_ROUTERS = ['store.routers.PrimaryReplicaRouter']
+STORE_DATABASE_REPLICAS = []
+if os.environ.get('BOOKS_DB_REPLICA_HOST'):
+    DATABASES['replica'] = {**DATABASES['default'], 'HOST': os.environ['BOOKS_DB_REPLICA_HOST'],
+                            'TEST': {'MIRROR': 'default'}}
+    STORE_DATABASE_REPLICAS = ['replica']
+# How long a client keeps reading from the primary after a write, longer than the replication lag.
+STORE_REPLICA_STICKY_SECONDS = 5
+
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.github.GithubOAuth2',
 
     'django.contrib.auth.backends.ModelBackend',
 )
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Use 'django.core.cache.backends.redis.RedisCache' with a LOCATION in production.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -144,13 +183,21 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'store.renderers.ORJSONRenderer',
     ),
     'DEFAULT_PARSER_CLASSES': (
         'rest_framework.parsers.JSONParser',
     )
 }
 
+STORE_CACHE_ALIAS = 'default'
+STORE_CACHE_TIMEOUT = 60
+STORE_FAST_BOOK_LIST = True
+# 'sync' updates book counters inside the request, 'deferred' queues them for the process_dirty_books worker,
+# which keeps them at most STORE_COUNTERS_MAX_DELAY seconds behind.
+STORE_COUNTERS_MODE = 'sync'
+STORE_COUNTERS_MAX_DELAY = 5
+
 SOCIAL_AUTH_JSONFIELD_ENABLED = True
 
 SOCIAL_AUTH_URL_NAMESPACE = 'social'
@@ -0,0 +1,11 @@
+"""
+Settings for the test suite: python manage.py test --settings=books.test_settings
+"""
+
+from books.settings import *  # noqa: F401,F403
+
+# A second database standing in for a read replica in the routing tests, not listed in STORE_DATABASE_REPLICAS.
+DATABASES['test_replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'test_replica.sqlite3',
+}
@@ -17,18 +17,23 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
 
-from store.views import BookViewSet, auth, UserBookRelationView
+from store import async_views
+from store.views import AuthorStatsViewSet, BookViewSet, auth, UserBookRelationView
 
 router = SimpleRouter()
 
 router.register(r'book', BookViewSet)
 router.register(r'book_relation', UserBookRelationView)
+router.register(r'author_stats', AuthorStatsViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('social_django.urls', namespace='social')),
     path('auth/', auth),
     path('__debug__/', include('debug_toolbar.urls')),
+    path('async/book/', async_views.book_list, name='async-book-list'),
+    path('async/book/<int:pk>/', async_views.book_detail, name='async-book-detail'),
+    path('async/book_relation/<int:book>/', async_views.book_relation, name='async-userbookrelation-detail'),
 ]
 
 urlpatterns += router.urls
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from store.models import Book, UserBookRelation
+from store.models import AuthorStats, Book, DirtyBook, UserBookRelation
 
 
 @admin.register(Book)
@@ -11,3 +11,24 @@ class BookAdmin(admin.ModelAdmin):
 @admin.register(UserBookRelation)
 class UserBookRelationAdmin(admin.ModelAdmin):
     list_display = ('user', 'book', 'like', 'in_bookmarks', 'rate')
+
+
+@admin.register(DirtyBook)
+class DirtyBookAdmin(admin.ModelAdmin):
+    list_display = ('book', 'created_at')
+
+
+@admin.register(AuthorStats)
+class AuthorStatsAdmin(admin.ModelAdmin):
+    list_display = ('author_name', 'books_count', 'price_sum', 'likes_count', 'ratings_count', 'rating_sum')
+    search_fields = ('author_name',)
+
+    # The rows are derived from the books, an edit here would only be overwritten by the next refresh.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,96 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.http import HttpResponse, HttpResponseNotAllowed
+from rest_framework import status
+from rest_framework.exceptions import (APIException, NotAuthenticated, NotFound, ParseError, PermissionDenied,
+                                       ValidationError)
+
+from store.logic import upsert_relation
+from store.middleware import serialization_timer
+from store.models import Book
+from store.renderers import ORJSONRenderer
+from store.serializers import abook_values_data, UserBookRelationSerializer
+from store.views import BookViewSet
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return HttpResponse(ORJSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def api_exception_response(exc):
+    detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return json_response(detail, status=exc.status_code)
+
+
+async def book_view(request, action):
+    # The sync BookViewSet builds the filtered, searched and ordered queryset lazily, so it is safe to reuse here.
+    view = BookViewSet(format_kwarg=None, action_map={'get': action}, args=(), kwargs={})
+    view.request = view.initialize_request(request)
+    # Authenticate off the event loop, BookViewSet reads the user to annotate their relations.
+    await sync_to_async(lambda: view.request.user)()
+    return view
+
+
+async def book_list(request):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    view = await book_view(request, 'list')
+    try:
+        readers_limit, fields = view.get_readers_limit(), view.get_book_fields()
+        queryset = view.get_values_queryset(view.filter_queryset(view.get_queryset()))
+        page = None
+        if view.paginator.get_page_size(view.request) is not None:
+            page = await sync_to_async(view.paginate_queryset)(queryset)
+    except APIException as exc:
+        return api_exception_response(exc)
+    rows = page if page is not None else [row async for row in queryset]
+    with serialization_timer(request):
+        data = await abook_values_data(rows, readers_limit, fields)
+    if page is not None:
+        data = view.get_paginated_response(data).data
+    return json_response(data)
+
+
+async def book_detail(request, pk):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    view = await book_view(request, 'retrieve')
+    try:
+        readers_limit, fields = view.get_readers_limit(), view.get_book_fields()
+        try:
+            row = await view.get_values_queryset(view.get_queryset()).aget(pk=pk)
+        except Book.DoesNotExist:
+            raise NotFound()
+    except APIException as exc:
+        return api_exception_response(exc)
+    with serialization_timer(request):
+        data, = await abook_values_data([row], readers_limit, fields)
+    return json_response(data)
+
+
+async def book_relation(request, book):
+    if request.method != 'PATCH':
+        return HttpResponseNotAllowed(['PATCH'])
+    try:
+        user = await sync_to_async(get_user)(request)
+        if not user.is_authenticated:
+            # Session authentication sends no WWW-Authenticate header, so DRF answers 403 here as well.
+            raise PermissionDenied(NotAuthenticated.default_detail)
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+        serializer = UserBookRelationSerializer(data=data, partial=True)
+        if not await sync_to_async(serializer.is_valid)():
+            raise ValidationError(serializer.errors)
+        serializer.validated_data.pop('book', None)
+        # The upsert and the counter deltas need one transaction, which the async ORM can't hold open.
+        try:
+            relation = await sync_to_async(upsert_relation)(user, book, serializer.validated_data)
+        except Book.DoesNotExist:
+            raise NotFound()
+    except APIException as exc:
+        return api_exception_response(exc)
+    return json_response(UserBookRelationSerializer(relation).data)
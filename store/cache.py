@@ -0,0 +1,148 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from store.models import Book
+
+BOOKS_VERSION_KEY = 'store:books:version'
+
+
+def get_cache():
+    return caches[getattr(settings, 'STORE_CACHE_ALIAS', 'default')]
+
+
+def book_version_key(book_id):
+    return f'store:book:{book_id}:version'
+
+
+def _get_versions(*keys):
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start from the clock so an evicted counter never reuses an old version.
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump_versions(*keys):
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump_book_version(book_id=None):
+    keys = (BOOKS_VERSION_KEY,) if book_id is None else (BOOKS_VERSION_KEY, book_version_key(book_id))
+    _bump_versions(*keys)
+    # Bump again once the write is visible, so a response rendered from
+    # the old rows inside that window does not survive the commit.
+    transaction.on_commit(lambda: _bump_versions(*keys))
+
+
+def bump_book_versions(book_ids):
+    """Like bump_book_version for each book, with one cache write and one on_commit callback for all of them."""
+    keys = [BOOKS_VERSION_KEY, *map(book_version_key, book_ids)]
+    _restart_versions(keys)
+    transaction.on_commit(lambda: _restart_versions(keys))
+
+
+def _restart_versions(keys):
+    # Counters can't be incremented in one round trip, so they restart from the clock as after an eviction.
+    get_cache().set_many(dict.fromkeys(keys, time.time_ns()), None)
+
+
+def _request_hash(request):
+    query = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+    # Books carry the requesting user's relation, so responses are cached per user.
+    return hashlib.md5(f'{request.user.pk}:{request.get_host()}{request.path}?{query}'.encode()).hexdigest()
+
+
+def book_list_cache_key(request):
+    version, = _get_versions(BOOKS_VERSION_KEY)
+    return f'store:book-list:{version}:{_request_hash(request)}'
+
+
+def book_cache_key(request, book_id):
+    version, = _get_versions(book_version_key(book_id))
+    return f'store:book:{book_id}:{version}:{_request_hash(request)}'
+
+
+def _etag(*parts):
+    return quote_etag(hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest())
+
+
+def _user_state_is_deferred(request):
+    # Deferred counters leave updated_at alone until the worker runs, so the user's own like, in_bookmarks and
+    # rate would hide behind a 304 meanwhile.
+    return getattr(settings, 'STORE_COUNTERS_MODE', 'sync') == 'deferred' and request.user.is_authenticated
+
+
+def book_list_validators(request):
+    # Every write to a book or a relation bumps the list version, deletes and the deferred counter updates included,
+    # while MAX(updated_at) and COUNT(*) can come back unchanged from a delete and an insert. With no Last-Modified
+    # for lists a client sending only If-Modified-Since can't miss a change.
+    version, = _get_versions(BOOKS_VERSION_KEY)
+    return _etag(version, _request_hash(request)), None
+
+
+def book_validators(request, book_id):
+    if _user_state_is_deferred(request):
+        return None, None
+    try:
+        updated_at = Book.objects.filter(pk=book_id).values_list('updated_at', flat=True).first()
+    except (TypeError, ValueError):
+        updated_at = None
+    if updated_at is None:
+        return None, None
+    # HTTP dates have a one second resolution, the ETag carries the exact time.
+    return _etag(updated_at, _request_hash(request)), int(updated_at.timestamp())
+
+
+def _not_modified(request, etag, last_modified):
+    response = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        response.headers['ETag'] = etag
+    return response
+
+
+def _set_validators(response, etag, last_modified):
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def cached_response(key, validators, view_method, request, *args, **kwargs):
+    """
+    Serve view_method from the cache under key, answering 304 when the client's If-None-Match/If-Modified-Since
+    match. The (etag, last_modified) pair is cached with the data; on a miss the validators callable computes it
+    with a cheap query before the view runs, so a polling client with an up to date copy skips the book query and
+    serialization.
+    """
+    cache = get_cache()
+    entry = cache.get(key)
+    if entry is not None:
+        data, etag, last_modified = entry
+        return _not_modified(request, etag, last_modified) or _set_validators(Response(data), etag, last_modified)
+    etag, last_modified = validators()
+    if etag is None:
+        return view_method(request, *args, **kwargs)
+    response = _not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    response = view_method(request, *args, **kwargs)
+    if response.status_code == status.HTTP_200_OK:
+        _set_validators(response, etag, last_modified)
+        cache.set(key, (response.data, etag, last_modified), getattr(settings, 'STORE_CACHE_TIMEOUT', 60))
+    return response
@@ -0,0 +1,37 @@
+import csv
+from itertools import islice
+
+from store.renderers import ORJSONRenderer
+from store.serializers import format_book_values
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def export_lines(queryset, fields, output, chunk_size=2000):
+    """
+    Yield the rows of a Book.objects.values() queryset as NDJSON or CSV lines restricted to fields, holding one
+    chunk of rows in memory at a time.
+    """
+    # iterator() streams through a server-side cursor on PostgreSQL instead of fetching the whole result.
+    rows = queryset.iterator(chunk_size=chunk_size)
+    writer = csv.writer(_Echo())
+    renderer = ORJSONRenderer()
+    if output == 'csv':
+        yield writer.writerow(fields)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        for book in format_book_values(chunk, {}, fields):
+            if output == 'csv':
+                yield writer.writerow([book[field] for field in fields])
+            else:
+                yield renderer.render(book).decode() + '\n'
@@ -1,9 +1,382 @@
-from django.db.models import Avg
+from django.conf import settings
+from django.db import connection, connections, router, transaction
+from django.db.models import CASCADE, Avg, Count, F, FloatField, Min, OuterRef, Subquery, Sum
+from django.db.models.deletion import Collector, get_candidate_relations_to_delete
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
 
-from store.models import UserBookRelation
+from store.cache import bump_book_version, bump_book_versions
+from store.models import AuthorStats, Book, DirtyBook, UserBookRelation, normalize_author_name
+
+COUNTER_FIELDS = ('likes_count', 'bookmarks_count', 'ratings_count', 'rating_sum')
+AUTHOR_COUNTER_FIELDS = ('likes_count', 'ratings_count', 'rating_sum')
+AUTHOR_STATS_FIELDS = ('author_name', 'books_count', 'price_sum', *AUTHOR_COUNTER_FIELDS)
+RELATION_FIELDS = ('like', 'in_bookmarks', 'rate')
+BOOK_BULK_UPDATE_FIELDS = ('name', 'price', 'author_name', 'author_key', 'updated_at')
 
 
 def set_rating(book):
-    rating = UserBookRelation.objects.filter(book=book).aggregate(rating=Avg('rate')).get('rating')
-    book.rating = rating
-    book.save()
+    result = UserBookRelation.objects.filter(book=book).aggregate(rating=Avg('rate'),
+                                                                  rating_sum=Sum('rate'),
+                                                                  ratings_count=Count('rate'))
+    book.rating = result['rating']
+    book.rating_sum = result['rating_sum'] or 0
+    book.ratings_count = result['ratings_count']
+    book.save(update_fields=['rating', 'rating_sum', 'ratings_count', 'updated_at'])
+
+
+def update_counters(book_id, old_state, new_state):
+    old_like, old_in_bookmarks, old_rate = old_state or (False, False, None)
+    like, in_bookmarks, rate = new_state or (False, False, None)
+    changes = {}
+    if like != old_like:
+        changes['likes_count'] = F('likes_count') + (like - old_like)
+    if in_bookmarks != old_in_bookmarks:
+        changes['bookmarks_count'] = F('bookmarks_count') + (in_bookmarks - old_in_bookmarks)
+    if rate != old_rate:
+        rating_sum = (rate or 0) - (old_rate or 0)
+        ratings_count = (rate is not None) - (old_rate is not None)
+        changes['rating_sum'] = F('rating_sum') + rating_sum
+        changes['ratings_count'] = F('ratings_count') + ratings_count
+        changes['rating'] = Cast(F('rating_sum') + rating_sum, FloatField()) / NullIf(
+            F('ratings_count') + ratings_count, 0)
+    if old_state != new_state:
+        # A new or removed relation changes the readers of the book even when no counter moves.
+        Book.objects.filter(pk=book_id).update(updated_at=timezone.now(), **changes)
+    author_changes = {field: changes[field] for field in AUTHOR_COUNTER_FIELDS if field in changes}
+    if author_changes:
+        AuthorStats.objects.filter(
+            author_key=Subquery(Book.objects.filter(pk=book_id).values('author_key')),
+        ).update(**author_changes)
+
+
+def counters_deferred():
+    return getattr(settings, 'STORE_COUNTERS_MODE', 'sync') == 'deferred'
+
+
+def record_relation_change(book_id, old_state, new_state):
+    if counters_deferred():
+        if old_state != new_state:
+            mark_books_dirty([book_id])
+    else:
+        update_counters(book_id, old_state, new_state)
+
+
+def mark_books_dirty(book_ids):
+    # An insert per change instead of an update of a shared row keeps hot books free of lock contention.
+    DirtyBook.objects.bulk_create(DirtyBook(book_id=book_id) for book_id in book_ids)
+
+
+def process_dirty_books(batch_size=500):
+    """Recompute the counters of up to batch_size queued changes at once, returns the number of rebuilt books."""
+    with transaction.atomic():
+        # Workers skip each other's batches; changes queued meanwhile get their own rows and the next batch.
+        claimed = list(DirtyBook.objects.select_for_update(skip_locked=True).order_by('id')
+                       .values_list('id', 'book_id')[:batch_size])
+        if not claimed:
+            return 0
+        book_ids = {book_id for _, book_id in claimed}
+        rebuild_counters(Book.objects.filter(id__in=book_ids))
+        DirtyBook.objects.filter(id__in=[dirty_id for dirty_id, _ in claimed]).delete()
+        for book_id in book_ids:
+            bump_book_version(book_id)
+    return len(book_ids)
+
+
+def _relations(**filters):
+    return UserBookRelation.objects.filter(book=OuterRef('pk'), **filters).order_by().values('book')
+
+
+def _count(**filters):
+    return Coalesce(Subquery(_relations(**filters).annotate(total=Count('id')).values('total')), 0)
+
+
+def rating_expressions():
+    return {
+        'rating_sum': Coalesce(Subquery(_relations(rate__isnull=False).annotate(total=Sum('rate')).values('total')), 0),
+        'ratings_count': _count(rate__isnull=False),
+        'rating': Subquery(_relations(rate__isnull=False).annotate(total=Avg('rate')).values('total')),
+    }
+
+
+def counter_expressions():
+    return {
+        'likes_count': _count(like=True),
+        'bookmarks_count': _count(in_bookmarks=True),
+        **rating_expressions(),
+    }
+
+
+def rebuild_ratings(books=None):
+    if books is None:
+        books = Book.objects.all()
+    with transaction.atomic(savepoint=False):
+        updated = books.update(updated_at=timezone.now(), **rating_expressions())
+        refresh_author_stats(book_author_keys(books))
+    return updated
+
+
+def rebuild_counters(books=None):
+    if books is None:
+        books = Book.objects.all()
+    with transaction.atomic(savepoint=False):
+        updated = books.update(updated_at=timezone.now(), **counter_expressions())
+        refresh_author_stats(book_author_keys(books))
+    return updated
+
+
+AGGREGATE_COUNTERS_SQL = """
+    UPDATE "store_book" SET
+        "likes_count" = counters.likes_count,
+        "bookmarks_count" = counters.bookmarks_count,
+        "ratings_count" = counters.ratings_count,
+        "rating_sum" = counters.rating_sum,
+        "rating" = counters.rating,
+        "updated_at" = %s
+    FROM (
+        SELECT "book_id",
+            SUM(CASE WHEN "like" THEN 1 ELSE 0 END) AS likes_count,
+            SUM(CASE WHEN "in_bookmarks" THEN 1 ELSE 0 END) AS bookmarks_count,
+            COUNT("rate") AS ratings_count,
+            COALESCE(SUM("rate"), 0) AS rating_sum,
+            AVG("rate") AS rating
+        FROM "store_userbookrelation"
+        WHERE "book_id" IN ({placeholders})
+        GROUP BY "book_id"
+    ) AS counters
+    WHERE "store_book"."id" = counters."book_id"
+"""
+
+
+def aggregate_counters(book_ids, batch_size=1000):
+    """
+    Recompute the counters of books with relations from one grouped scan of the relations per batch of books,
+    instead of rebuild_counters' correlated subqueries per book. Books without relations are left untouched.
+    """
+    book_ids = sorted(set(book_ids))
+    updated = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(book_ids), batch_size):
+            batch = book_ids[start:start + batch_size]
+            cursor.execute(AGGREGATE_COUNTERS_SQL.format(placeholders=', '.join(['%s'] * len(batch))),
+                           [connection.ops.adapt_datetimefield_value(timezone.now()), *batch])
+            updated += cursor.rowcount
+    refresh_author_stats(book_author_keys(Book.objects.filter(id__in=book_ids)))
+    return updated
+
+
+def find_counter_drift(books=None):
+    if books is None:
+        books = Book.objects.all()
+    expressions = counter_expressions()
+    books = books.annotate(**{f'expected_{field}': expressions[field] for field in COUNTER_FIELDS})
+    return books.exclude(**{field: F(f'expected_{field}') for field in COUNTER_FIELDS}).order_by('id')
+
+
+def book_author_keys(books):
+    return books.order_by().values_list('author_key', flat=True).distinct()
+
+
+def aggregate_author_stats(books=None):
+    """Compute the author stats of books from scratch, one row per author_key."""
+    if books is None:
+        books = Book.objects.all()
+    return books.order_by().values('author_key').annotate(
+        author_name=Min('author_name'), books_count=Count('id'), price_sum=Sum('price'),
+        **{field: Sum(field) for field in AUTHOR_COUNTER_FIELDS},
+    )
+
+
+def refresh_author_stats(author_keys, batch_size=1000):
+    """
+    Recompute the stats of the authors with author_keys from their books. The author rows are locked before their
+    books are read, so a concurrent counter delta either lands before the read or waits and applies on top.
+    """
+    author_keys = sorted(set(author_keys))
+    stats_connection = connections[router.db_for_write(AuthorStats)]
+    for start in range(0, len(author_keys), batch_size):
+        batch = author_keys[start:start + batch_size]
+        with transaction.atomic(savepoint=False):
+            if stats_connection.vendor == 'postgresql':
+                # A new author has no row to lock yet, and two refreshes that both read no books before the other's
+                # insert would each write a stale row: serialize the refreshes of a key on an advisory lock too.
+                with stats_connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_xact_lock(hashtext(key)) FROM unnest(%s::text[]) AS key '
+                                   'ORDER BY key', [batch])
+            list(AuthorStats.objects.select_for_update().filter(author_key__in=batch).order_by('author_key')
+                 .values_list('id', flat=True))
+            stats = [AuthorStats(**row) for row in aggregate_author_stats(Book.objects.filter(author_key__in=batch))]
+            AuthorStats.objects.bulk_create(stats, update_conflicts=True, unique_fields=['author_key'],
+                                            update_fields=AUTHOR_STATS_FIELDS)
+            AuthorStats.objects.filter(author_key__in=set(batch) - {row.author_key for row in stats}).delete()
+
+
+def rebuild_author_stats():
+    refresh_author_stats({*AuthorStats.objects.values_list('author_key', flat=True),
+                          *book_author_keys(Book.objects.all())})
+
+
+def find_author_stats_drift():
+    """Compare AuthorStats with a from-scratch aggregate, returns {author_key: {field: (stored, expected)}}."""
+    stored = {row['author_key']: row for row in AuthorStats.objects.values('author_key', *AUTHOR_STATS_FIELDS)}
+    empty = dict.fromkeys(AUTHOR_STATS_FIELDS)
+    drift = {}
+    for row in aggregate_author_stats():
+        current = stored.pop(row['author_key'], empty)
+        changes = {field: (current[field], row[field]) for field in AUTHOR_STATS_FIELDS
+                   if current[field] != row[field]}
+        if changes:
+            drift[row['author_key']] = changes
+    for author_key, current in stored.items():
+        drift[author_key] = {field: (current[field], None) for field in AUTHOR_STATS_FIELDS}
+    return drift
+
+
+def bulk_update_relations(user, items):
+    """Upsert the relations of user described by items and recompute counters once per book."""
+    book_ids = {item['book'] for item in items}
+    # Fields no item sets are left to whatever a concurrent insert of the same relation wrote.
+    fields = [field for field in RELATION_FIELDS if any(field in item for item in items)]
+    with transaction.atomic():
+        # Locked, so a concurrent write to these relations can't land between the read and the merged write.
+        relations = {relation.book_id: relation
+                     for relation in UserBookRelation.objects.select_for_update()
+                     .filter(user=user, book_id__in=book_ids).order_by('book_id')}
+        for item in items:
+            relation = relations.get(item['book']) or UserBookRelation(user=user, book_id=item['book'])
+            for field in RELATION_FIELDS:
+                if field in item:
+                    setattr(relation, field, item[field])
+            relations[item['book']] = relation
+        UserBookRelation.objects.bulk_create(
+            [UserBookRelation(user=user, book_id=relation.book_id,
+                              **{field: getattr(relation, field) for field in RELATION_FIELDS})
+             for relation in relations.values()],
+            **({'update_conflicts': True, 'unique_fields': ['user', 'book'], 'update_fields': fields} if fields else
+               {'ignore_conflicts': True}),
+        )
+        if counters_deferred():
+            mark_books_dirty(book_ids)
+        else:
+            rebuild_counters(Book.objects.filter(id__in=book_ids))
+        bump_book_versions(book_ids)
+
+
+def bulk_create_books(owner, items):
+    """Insert the books described by items for owner in one statement, returns them with their ids."""
+    books = [Book(owner=owner, author_key=normalize_author_name(item['author_name']), **item) for item in items]
+    with transaction.atomic(savepoint=False):
+        Book.objects.bulk_create(books)
+        refresh_author_stats({book.author_key for book in books})
+        bump_book_version()
+    return books
+
+
+def bulk_update_books(books, items):
+    """Apply items to the loaded books in one UPDATE, bulk_update skips Book.save so author_key is kept here."""
+    author_keys = {book.author_key for book in books}
+    updated_at = timezone.now()
+    for book, item in zip(books, items):
+        for field, value in item.items():
+            setattr(book, field, value)
+        book.author_key = normalize_author_name(book.author_name)
+        book.updated_at = updated_at
+        author_keys.add(book.author_key)
+    with transaction.atomic(savepoint=False):
+        Book.objects.bulk_update(books, BOOK_BULK_UPDATE_FIELDS)
+        refresh_author_stats(author_keys)
+        bump_book_versions([book.id for book in books])
+    return books
+
+
+def bulk_delete_books(books):
+    """
+    Delete books with one DELETE per table. Book and UserBookRelation have delete signal receivers, so the
+    collector would load every relation of the books to send signals that only update the books' counters, stats
+    and caches. Cascades to rows nothing else refers to are deleted without loading them instead, the stats and
+    caches are updated below once for all the books.
+    """
+    book_ids = [book.id for book in books]
+    if not book_ids:
+        return
+    alias = router.db_for_write(Book)
+    collector = Collector(alias)
+    with transaction.atomic(using=alias, savepoint=False):
+        # The relations the collector would follow, hidden ones such as DirtyBook.book included.
+        for related in get_candidate_relations_to_delete(Book._meta):
+            rows = related.related_model._base_manager.using(alias).filter(**{f'{related.field.name}__in': book_ids})
+            if related.on_delete is CASCADE and not any(get_candidate_relations_to_delete(related.related_model._meta)):
+                rows._raw_delete(alias)
+            else:
+                # Any other on_delete, or a cascade that goes further, is left to the collector.
+                related.on_delete(collector, related.field, rows, alias)
+        collector.delete()
+        Book._base_manager.using(alias).filter(id__in=book_ids)._raw_delete(alias)
+        refresh_author_stats({book.author_key for book in books})
+        bump_book_versions(book_ids)
+
+
+class _RelationRace(Exception):
+    pass
+
+
+UPSERT_RELATION_SQL = """
+    WITH old AS MATERIALIZED (
+        SELECT "like", "in_bookmarks", "rate" FROM "store_userbookrelation"
+        WHERE "user_id" = %(user_id)s AND "book_id" = %(book_id)s
+        FOR UPDATE
+    )
+    INSERT INTO "store_userbookrelation" AS relation ("user_id", "book_id", "like", "in_bookmarks", "rate")
+    SELECT %(user_id)s, book."id", %(like)s, %(in_bookmarks)s, %(rate)s::smallint
+    FROM "store_book" AS book LEFT JOIN old ON true
+    WHERE book."id" = %(book_id)s
+    ON CONFLICT ("user_id", "book_id") DO UPDATE SET {updates}
+    RETURNING relation."id", relation."book_id", relation."like", relation."in_bookmarks", relation."rate", relation.xmax = 0,
+        (SELECT count(*) FROM old), (SELECT "like" FROM old), (SELECT "in_bookmarks" FROM old), (SELECT "rate" FROM old)
+"""
+
+
+def update_relation(user, book_id, data):
+    """Apply data to the relation of user and book under a row lock so concurrent updates don't lose counter deltas."""
+    with transaction.atomic():
+        if not Book.objects.filter(pk=book_id).exists():
+            raise Book.DoesNotExist()
+        relation, _ = UserBookRelation.objects.select_for_update().get_or_create(user=user, book_id=book_id)
+        for field, value in data.items():
+            setattr(relation, field, value)
+        relation.save()
+    return relation
+
+
+def upsert_relation(user, book_id, data):
+    """
+    Insert or update the relation of user and book with one INSERT ... ON CONFLICT DO UPDATE, which also returns the
+    previous state under a lock on the relation row only, then apply the counter deltas without reading Book.
+    """
+    if connection.vendor != 'postgresql':
+        return update_relation(user, book_id, data)
+    fields = [field for field in RELATION_FIELDS if field in data]
+    params = {'user_id': user.pk, 'book_id': book_id, 'like': False, 'in_bookmarks': False, 'rate': None,
+              **{field: data[field] for field in fields}}
+    updates = ', '.join(f'"{field}" = EXCLUDED."{field}"' for field in fields) or '"like" = relation."like"'
+    while True:
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(UPSERT_RELATION_SQL.format(updates=updates), params)
+                    row = cursor.fetchone()
+                if row is None:
+                    raise Book.DoesNotExist()
+                relation_id, book_id, like, in_bookmarks, rate, inserted, old_exists, *old_state = row
+                if not inserted and not old_exists:
+                    # A concurrent request created the relation after our lookup, so its previous state is unknown:
+                    # roll the upsert back and retry against the now committed row.
+                    raise _RelationRace()
+                relation = UserBookRelation(id=relation_id, user=user, book_id=book_id, like=like,
+                                            in_bookmarks=in_bookmarks, rate=rate)
+                relation.old_state = relation.state
+                record_relation_change(book_id, tuple(old_state) if old_exists else None, relation.state)
+        except _RelationRace:
+            continue
+        bump_book_version(book_id)
+        return relation
@@ -0,0 +1,133 @@
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from store.logic import rebuild_counters
+from store.models import Book, UserBookRelation
+
+WORDS = ('dune', 'river', 'night', 'garden', 'winter', 'glass', 'stone', 'harbor')
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = 'Seed books, users and relations, then measure queries, latency and memory of the store API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000', help='Comma separated numbers of books to seed.')
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--relations-per-book', type=int, default=5)
+        parser.add_argument('--requests', type=int, default=30, help='Requests per scenario.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--max-query-growth', type=int, default=0,
+                            help='Fail when a scenario runs more queries than this on the largest size '
+                                 'compared to the smallest one.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        random.seed(options['seed'])
+        # Measure the database path, not the response cache.
+        with override_settings(STORE_CACHE_TIMEOUT=0, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            results = {size: self.run_size(size, options) for size in sizes}
+
+        regressions = []
+        for scenario, smallest in results[sizes[0]].items():
+            growth = results[sizes[-1]][scenario]['queries'] - smallest['queries']
+            if growth > options['max_query_growth']:
+                regressions.append(f'{scenario}: {smallest["queries"]} queries with {sizes[0]} books, '
+                                   f'{results[sizes[-1]][scenario]["queries"]} with {sizes[-1]} books')
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'sizes': results, 'regressions': regressions}, output, indent=2)
+        if regressions:
+            raise CommandError('Query count grows with data size:\n' + '\n'.join(regressions))
+
+    def run_size(self, size, options):
+        with transaction.atomic():
+            user, books = self.seed(size, options)
+            client = Client()
+            client.force_login(user)
+            book = books[len(books) // 2]
+            relation_url = reverse('userbookrelation-detail', args=(book.id,))
+            scenarios = {
+                'list': lambda: client.get(reverse('book-list')),
+                'list_page': lambda: client.get(reverse('book-list'), {'page_size': 20}),
+                'detail': lambda: client.get(reverse('book-detail', args=(book.id,))),
+                'filter': lambda: client.get(reverse('book-list'), {'price': str(book.price)}),
+                'search': lambda: client.get(reverse('book-list'), {'search': random.choice(WORDS)}),
+                'ordering': lambda: client.get(reverse('book-list'), {'ordering': '-price', 'page_size': 20}),
+                'relation_update': lambda: client.patch(relation_url, json.dumps({'like': random.random() < 0.5}),
+                                                        content_type='application/json'),
+            }
+            results = {}
+            for name, request in scenarios.items():
+                results[name] = self.measure(request, options['requests'])
+                self.stdout.write(f'{size:>8} {name:<16} queries={results[name]["queries"]:<4} '
+                                  f'p50={results[name]["p50_ms"]:.1f}ms p95={results[name]["p95_ms"]:.1f}ms '
+                                  f'p99={results[name]["p99_ms"]:.1f}ms peak={results[name]["peak_kb"]:.0f}KiB')
+            transaction.set_rollback(True)
+        return results
+
+    def seed(self, size, options):
+        prefix = f'bench_{time.time_ns()}'
+        users = User.objects.bulk_create(User(username=f'{prefix}_{i}') for i in range(options['users']))
+        books = Book.objects.bulk_create(
+            Book(name=f'{random.choice(WORDS).title()} {random.choice(WORDS)} {i}',
+                 price=f'{random.randint(100, 9999) / 100:.2f}',
+                 author_name=f'Author {random.randint(1, max(1, size // 10))}')
+            for i in range(size)
+        )
+        relations_per_book = min(options['relations_per_book'], len(users))
+        UserBookRelation.objects.bulk_create(
+            UserBookRelation(user=reader, book=book, like=random.random() < 0.5,
+                             in_bookmarks=random.random() < 0.2, rate=random.choice((None, 1, 2, 3, 4, 5)))
+            for book in books for reader in random.sample(users, relations_per_book)
+        )
+        rebuild_counters(Book.objects.filter(id__in=[book.id for book in books]))
+        if connection.vendor in ('postgresql', 'sqlite'):
+            # Give the planner statistics for the freshly seeded rows.
+            with connection.cursor() as cursor:
+                for table in (User._meta.db_table, Book._meta.db_table, UserBookRelation._meta.db_table):
+                    cursor.execute(f'ANALYZE {table}')
+        return users[0], books
+
+    def measure(self, request, count):
+        response = request()
+        if response.status_code >= 400:
+            raise CommandError(f'{response.status_code} response: {response.content[:200]}')
+        # Tracing allocations and capturing queries both slow requests down, so latency is timed without either and
+        # the queries and peak memory come from one more request.
+        latencies = []
+        for _ in range(count):
+            started = time.perf_counter()
+            request()
+            latencies.append((time.perf_counter() - started) * 1000)
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as captured:
+                request()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        queries = len(captured)
+        return {
+            'queries': queries,
+            'p50_ms': statistics.median(latencies),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'peak_kb': peak / 1024,
+        }
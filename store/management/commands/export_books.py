@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpRequest, QueryDict
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+
+from store.export import EXPORT_FORMATS
+from store.views import BookViewSet
+
+
+class Command(BaseCommand):
+    help = 'Stream the book catalog as NDJSON or CSV, filtered like GET /book/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--file', help='Write to this file instead of stdout.')
+        parser.add_argument('--chunk-size', type=int, default=BookViewSet.export_chunk_size)
+        parser.add_argument('--fields', help='Comma separated fields, as ?fields= of the book API.')
+        parser.add_argument('--search')
+        parser.add_argument('--ordering')
+        parser.add_argument('--price')
+
+    def handle(self, *args, **options):
+        params = QueryDict(mutable=True)
+        for param in ('fields', 'search', 'ordering', 'price'):
+            if options[param] is not None:
+                params[param] = options[param]
+        request = HttpRequest()
+        request.method = 'GET'
+        request.GET = params
+        view = BookViewSet(request=Request(request), format_kwarg=None, action='export', args=(), kwargs={},
+                           export_chunk_size=options['chunk_size'])
+        try:
+            lines, _ = view.get_export(options['output'])
+        except ValidationError as exc:
+            raise CommandError(exc.detail)
+        if options['file']:
+            with open(options['file'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,161 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from store.cache import bump_book_versions
+from store.logic import RELATION_FIELDS, aggregate_counters, refresh_author_stats
+from store.models import Book, UserBookRelation, normalize_author_name
+
+BOOK_FIELDS = ('name', 'price', 'author_name')
+
+
+def read_rows(path, input_format):
+    with open(path, newline='') as input:
+        if input_format == 'csv':
+            for line, row in enumerate(csv.DictReader(input), start=2):
+                yield line, row
+        else:
+            for line, text in enumerate(input, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    row = json.loads(text)
+                except ValueError as exc:
+                    row = exc
+                yield line, row
+
+
+def clean(model, row, fields, required):
+    """Convert the values of fields in row with the model fields, returns (values, errors)."""
+    values, errors = {}, {}
+    for field in fields:
+        value = row.get(field)
+        if value in (None, ''):
+            if field in required:
+                errors[field] = ['This field is required.']
+            continue
+        try:
+            values[field] = model._meta.get_field(field).clean(value, None)
+        except ValidationError as exc:
+            errors[field] = exc.messages
+    return values, errors
+
+
+class Command(BaseCommand):
+    help = 'Bulk import books or user ratings from CSV or NDJSON, recomputing book counters once at the end.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--kind', choices=['books', 'relations'], default='books',
+                            help='books rows have name, price, author_name and an optional owner username; '
+                                 'relations rows have a user name, a book id, like, in_bookmarks and rate.')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='Input format, guessed from the file extension by default.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        input_format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'ndjson')
+        if not os.path.exists(options['path']):
+            raise CommandError(f'{options["path"]} does not exist.')
+        import_batch = self.import_books if options['kind'] == 'books' else self.import_relations
+        self.imported = self.bad = 0
+        self.book_ids = set()
+        self.author_keys = set()
+        started = time.perf_counter()
+        rows = read_rows(options['path'], input_format)
+        with transaction.atomic():
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                import_batch(batch)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{self.imported + self.bad} rows, {self.imported / elapsed:.0f} rows/s')
+            if self.book_ids:
+                # One grouped UPDATE per batch of books instead of a recompute per saved relation.
+                aggregate_counters(self.book_ids, options['batch_size'])
+            refresh_author_stats(self.author_keys, options['batch_size'])
+            # The list and the details of the books whose relations were imported, new books have no cached detail.
+            bump_book_versions(self.book_ids)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {self.imported} {options["kind"]} in {elapsed:.1f}s ({self.imported / elapsed:.0f} rows/s), '
+            f'{self.bad} bad rows'))
+
+    def report(self, line, errors):
+        self.bad += 1
+        self.stderr.write(f'Line {line}: {errors}')
+
+    def import_books(self, batch):
+        usernames = {row.get('owner') for _, row in batch if isinstance(row, dict) and row.get('owner')}
+        owners = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        books = []
+        for line, row in batch:
+            if not isinstance(row, dict):
+                self.report(line, row)
+                continue
+            values, errors = clean(Book, row, BOOK_FIELDS, BOOK_FIELDS)
+            if row.get('owner'):
+                values['owner_id'] = owners.get(row['owner'])
+                if values['owner_id'] is None:
+                    errors['owner'] = [f'User {row["owner"]} does not exist.']
+            if errors:
+                self.report(line, errors)
+            else:
+                books.append(Book(author_key=normalize_author_name(values['author_name']), **values))
+        Book.objects.bulk_create(books)
+        self.author_keys.update(book.author_key for book in books)
+        self.imported += len(books)
+
+    def import_relations(self, batch):
+        rows = [(line, row) for line, row in batch if isinstance(row, dict)]
+        users = dict(User.objects.filter(username__in={row.get('user') for _, row in rows}).values_list('username',
+                                                                                                          'id'))
+        book_ids = set()
+        for _, row in rows:
+            try:
+                book_ids.add(int(row.get('book')))
+            except (TypeError, ValueError):
+                pass
+        existing_books = set(Book.objects.filter(id__in=book_ids).values_list('id', flat=True))
+        relations = {}
+        for line, row in batch:
+            if not isinstance(row, dict):
+                self.report(line, row)
+                continue
+            values, errors = clean(UserBookRelation, row, RELATION_FIELDS, ())
+            user_id = users.get(row.get('user'))
+            if user_id is None:
+                errors['user'] = [f'User {row.get("user")} does not exist.']
+            try:
+                book_id = int(row.get('book'))
+            except (TypeError, ValueError):
+                book_id = None
+            if book_id not in existing_books:
+                errors['book'] = [f'Book {row.get("book")} does not exist.']
+            if errors:
+                self.report(line, errors)
+                continue
+            # Rows only set the columns they have, later rows of a batch for one user and book win per column.
+            relations[user_id, book_id] = {**relations.get((user_id, book_id), {}), **values}
+            self.imported += 1
+        if relations:
+            states = {(user_id, book_id): dict(zip(RELATION_FIELDS, state)) for user_id, book_id, *state in
+                      UserBookRelation.objects.filter(user_id__in={user_id for user_id, _ in relations},
+                                                      book_id__in={book_id for _, book_id in relations})
+                      .values_list('user_id', 'book_id', *RELATION_FIELDS)}
+            UserBookRelation.objects.bulk_create(
+                [UserBookRelation(user_id=user_id, book_id=book_id, **{
+                    **states.get((user_id, book_id), {'like': False, 'in_bookmarks': False, 'rate': None}),
+                    **values})
+                 for (user_id, book_id), values in relations.items()],
+                update_conflicts=True, unique_fields=['user', 'book'], update_fields=RELATION_FIELDS,
+            )
+        self.book_ids.update(book_id for _, book_id in relations)
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import random
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from store.management.commands.bench_store import Command as BenchCommand
+
+
+class Command(BaseCommand):
+    help = 'Compare requests per second of the sync (WSGI) and async (ASGI) book API views in one worker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=200)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--relations-per-book', type=int, default=5)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario and path.')
+        parser.add_argument('--concurrency', type=int, default=10, help='Concurrent requests on the async path.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        with override_settings(STORE_CACHE_TIMEOUT=0, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            with transaction.atomic():
+                user, books = BenchCommand().seed(options['books'], options)
+                results = self.run(user, books[len(books) // 2], options)
+                transaction.set_rollback(True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+
+    def run(self, user, book, options):
+        client = Client()
+        client.force_login(user)
+        async_client = AsyncClient()
+        async_client.force_login(user)
+        like = lambda: json.dumps({'like': random.random() < 0.5})
+        scenarios = {
+            'list_page': (
+                lambda: client.get(reverse('book-list'), {'page_size': 20}),
+                lambda: async_client.get(reverse('async-book-list'), {'page_size': 20}),
+            ),
+            'detail': (
+                lambda: client.get(reverse('book-detail', args=(book.id,))),
+                lambda: async_client.get(reverse('async-book-detail', args=(book.id,))),
+            ),
+            'relation_update': (
+                lambda: client.patch(reverse('userbookrelation-detail', args=(book.id,)), like(),
+                                     content_type='application/json'),
+                lambda: async_client.patch(reverse('async-userbookrelation-detail', args=(book.id,)), like(),
+                                           content_type='application/json'),
+            ),
+        }
+        results = {}
+        for name, (sync_request, async_request) in scenarios.items():
+            results[name] = {
+                'wsgi_rps': self.measure_sync(sync_request, options['requests']),
+                # async_to_sync keeps the thread sensitive ORM calls on this thread and its open transaction.
+                'asgi_rps': async_to_sync(self.measure_async)(async_request, options['requests'],
+                                                              options['concurrency']),
+            }
+            self.stdout.write(f'{name:<16} wsgi={results[name]["wsgi_rps"]:.1f}req/s '
+                              f'asgi={results[name]["asgi_rps"]:.1f}req/s')
+        return results
+
+    def check_response(self, response):
+        if response.status_code >= 400:
+            raise CommandError(f'{response.status_code} response: {response.content[:200]}')
+
+    def measure_sync(self, request, count):
+        self.check_response(request())
+        started = time.perf_counter()
+        for _ in range(count):
+            self.check_response(request())
+        return count / (time.perf_counter() - started)
+
+    async def measure_async(self, request, count, concurrency):
+        self.check_response(await request())
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited():
+            async with semaphore:
+                self.check_response(await request())
+
+        started = time.perf_counter()
+        await asyncio.gather(*(limited() for _ in range(count)))
+        return count / (time.perf_counter() - started)
@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store.logic import process_dirty_books
+from store.models import DirtyBook
+
+
+class Command(BaseCommand):
+    help = 'Recompute the counters of books queued in deferred STORE_COUNTERS_MODE.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit instead of polling.')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Seconds between polls of an empty queue, half of STORE_COUNTERS_MAX_DELAY '
+                                 'by default.')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] if options['interval'] is not None else self.max_delay() / 2
+        while True:
+            self.check_delay()
+            rebuilt = 0
+            while True:
+                processed = process_dirty_books(options['batch_size'])
+                if not processed:
+                    break
+                rebuilt += processed
+            if rebuilt:
+                self.stdout.write(f'Rebuilt counters of {rebuilt} books')
+            if options['once']:
+                break
+            time.sleep(interval)
+
+    def max_delay(self):
+        return getattr(settings, 'STORE_COUNTERS_MAX_DELAY', 5)
+
+    def check_delay(self):
+        oldest = DirtyBook.objects.order_by('id').values_list('created_at', flat=True).first()
+        if oldest is not None:
+            delay = (timezone.now() - oldest).total_seconds()
+            if delay > self.max_delay():
+                self.stderr.write(self.style.WARNING(
+                    f'Counters are {delay:.1f}s behind, more than STORE_COUNTERS_MAX_DELAY; add workers '
+                    f'or raise --batch-size'))
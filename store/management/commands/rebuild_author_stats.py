@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from store.logic import find_author_stats_drift, rebuild_author_stats
+
+
+class Command(BaseCommand):
+    help = 'Compare the author stats table with a from-scratch aggregate of the books and rebuild it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report drifted authors.')
+
+    def handle(self, *args, **options):
+        drift = find_author_stats_drift()
+        for author_key, changes in sorted(drift.items()):
+            changes = ', '.join(f'{field} {stored} != {expected}' for field, (stored, expected) in changes.items())
+            self.stdout.write(f'Author {author_key!r}: {changes}')
+        self.stdout.write(f'Found {len(drift)} authors with drifted stats')
+        if not options['check']:
+            rebuild_author_stats()
+            self.stdout.write(self.style.SUCCESS('Rebuilt author stats'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from store.cache import bump_book_version
+from store.logic import rebuild_ratings
+from store.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Recompute rating, rating_sum and ratings_count of books from their relations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('book_ids', nargs='*', type=int, help='Only rebuild these books.')
+
+    def handle(self, *args, **options):
+        books = Book.objects.all()
+        if options['book_ids']:
+            books = books.filter(id__in=options['book_ids'])
+        updated = rebuild_ratings(books)
+        for book_id in options['book_ids'] or [None]:
+            bump_book_version(book_id)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings of {updated} books'))
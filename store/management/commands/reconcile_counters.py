@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.cache import bump_book_version
+from store.logic import COUNTER_FIELDS, find_counter_drift, rebuild_counters
+from store.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Compare the like, bookmark and rating counters of books with their relations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite drifted counters.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = list(find_counter_drift())
+            for book in drifted:
+                changes = ', '.join(f'{field} {getattr(book, field)} != {getattr(book, "expected_" + field)}'
+                                    for field in COUNTER_FIELDS
+                                    if getattr(book, field) != getattr(book, 'expected_' + field))
+                self.stdout.write(f'Book {book.id}: {changes}')
+            if drifted and options['fix']:
+                rebuild_counters(Book.objects.filter(id__in=[book.id for book in drifted]))
+                for book in drifted:
+                    bump_book_version(book.id)
+                self.stdout.write(self.style.SUCCESS(f'Fixed counters of {len(drifted)} books'))
+            else:
+                self.stdout.write(f'Found {len(drifted)} books with drifted counters')
@@ -0,0 +1,33 @@
+import os
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from store.snapshot import build_snapshot, default_path, update_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write or update the columnar snapshot of book ids, prices, ratings, likes and authors for analytics.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Snapshot file, STORE_SNAPSHOT_PATH by default.')
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild from scratch instead of applying the books changed since the last snapshot.')
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        path = options['path'] or default_path()
+        started = time.perf_counter()
+        try:
+            if options['full'] or not os.path.exists(path):
+                snapshot = build_snapshot(path, options['chunk_size'])
+                summary = 'full rebuild'
+            else:
+                snapshot, changed, deleted = update_snapshot(path, options['chunk_size'])
+                summary = f'{changed} changed, {deleted} deleted'
+        except (ImproperlyConfigured, ValueError) as exc:
+            raise CommandError(exc)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {len(snapshot)} books to {path} ({summary}, {os.path.getsize(path) / 1024:.0f} KiB) in '
+            f'{time.perf_counter() - started:.1f}s'))
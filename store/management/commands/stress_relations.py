@@ -0,0 +1,80 @@
+import random
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from store.logic import COUNTER_FIELDS, find_counter_drift, update_relation, upsert_relation
+from store.models import Book, UserBookRelation
+
+WRITERS = {
+    'upsert': upsert_relation,
+    'locked': update_relation,
+}
+
+
+class Command(BaseCommand):
+    help = 'Update the relations of one hot book from concurrent threads, then check that no counter update was lost.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--updates', type=int, default=200, help='Updates per thread.')
+        parser.add_argument('--users', type=int, default=20, help='Users sharing the book, fewer means more conflicts.')
+        parser.add_argument('--writers', default=','.join(WRITERS), help='Comma separated writers to compare.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            # SQLite upgrades deferred transactions to write locks and fails concurrent writers with 'database is locked'.
+            raise CommandError('Concurrent writers need PostgreSQL.')
+        results = {}
+        for name in options['writers'].split(','):
+            if name not in WRITERS:
+                raise CommandError(f'Unknown writer {name}, expected one of {", ".join(WRITERS)}.')
+            results[name] = self.run(WRITERS[name], options)
+            self.stdout.write(f'{name:<8} {results[name]:.1f} writes/s')
+
+    def run(self, writer, options):
+        # Threads use their own connections, so the data has to be committed and is removed afterwards.
+        prefix = f'stress_{time.time_ns()}'
+        users = User.objects.bulk_create(User(username=f'{prefix}_{i}') for i in range(options['users']))
+        book = Book.objects.create(name=prefix, price='1.00', author_name=prefix)
+        errors = []
+
+        def work(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(options['updates']):
+                    data = {field: value for field, value in (('like', rng.random() < 0.5),
+                                                              ('in_bookmarks', rng.random() < 0.5),
+                                                              ('rate', rng.choice((None, 1, 2, 3, 4, 5))))
+                            if rng.random() < 0.7}
+                    writer(rng.choice(users), book.id, data)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, args=(options['seed'] + i,)) for i in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        try:
+            if errors:
+                raise CommandError(f'{len(errors)} threads failed: {errors[0]!r}')
+            drifted = list(find_counter_drift(Book.objects.filter(id=book.id)))
+            if drifted:
+                raise CommandError('Lost updates: ' + ', '.join(
+                    f'{field} {getattr(drifted[0], field)} != {getattr(drifted[0], "expected_" + field)}'
+                    for field in COUNTER_FIELDS))
+            if UserBookRelation.objects.filter(book=book).count() > len(users):
+                raise CommandError('Duplicate relations were created.')
+        finally:
+            book.delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+        return options['threads'] * options['updates'] / elapsed
@@ -0,0 +1,164 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('store.metrics')
+
+
+class QueryMetrics:
+    """
+    Database execute wrapper counting the queries of a request and their time. Statements are counted by their
+    SQL with the parameters left out, so a loop issuing the same query per object stands out.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def repeated(self, threshold):
+        return [{'sql': sql[:200], 'count': count} for sql, count in self.statements.most_common()
+                if count >= threshold]
+
+
+# The QueryMetrics of the current request, sync_to_async carries it to the thread running the request's queries.
+_request_queries = ContextVar('store_request_queries', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    queries = _request_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+
+def _install_query_counter():
+    # Left installed: concurrent async requests share the connections of sync_to_async's thread, a wrapper pushed
+    # and popped per request would pop another request's.
+    for connection in connections.all():
+        if _count_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(_count_query)
+
+
+@contextmanager
+def serialization_timer(request):
+    """Count the time of the block, less its queries, as serialization time of request."""
+    request = getattr(request, '_request', request)
+    queries = getattr(request, '_store_query_metrics', None)
+    if queries is None:
+        yield
+        return
+    start, db_start = time.perf_counter(), queries.duration
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start - (queries.duration - db_start)
+        request._store_serialize_time = getattr(request, '_store_serialize_time', 0.0) + elapsed
+
+
+class RequestMetricsMiddleware:
+    """
+    Record the view name, query count, database, serialization and render time and response size of every request.
+    They are logged as JSON to the 'store.metrics' logger at INFO and sent in a Server-Timing header. Statements
+    repeated at least STORE_METRICS_N_PLUS_ONE_THRESHOLD times in one request are logged at WARNING as N+1 queries.
+
+    Serialization time is what views measure with serialization_timer, render time covers encoding a DRF/template
+    response. Each excludes the others, app time is the rest.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'STORE_REQUEST_METRICS', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'STORE_METRICS_N_PLUS_ONE_THRESHOLD', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        _install_query_counter()
+        queries = QueryMetrics()
+        request._store_query_metrics = queries
+        counting = _request_queries.set(queries)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(counting)
+        return self.record(request, response, start, queries)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        # The ORM runs in sync_to_async's thread, on that thread's connections.
+        await sync_to_async(_install_query_counter)()
+        queries = QueryMetrics()
+        request._store_query_metrics = queries
+        counting = _request_queries.set(queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(counting)
+        return self.record(request, response, start, queries)
+
+    def record(self, request, response, start, queries):
+        total = time.perf_counter() - start
+        render = getattr(request, '_store_render_time', 0.0)
+        serialize = getattr(request, '_store_serialize_time', 0.0)
+        metrics = {
+            'view': request.resolver_match.view_name if request.resolver_match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': queries.count,
+            'db_ms': round(queries.duration * 1000, 2),
+            'serialize_ms': round(serialize * 1000, 2),
+            'render_ms': round(render * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'size': None if response.streaming else len(response.content),
+        }
+        repeated = queries.repeated(self.threshold)
+        if repeated:
+            metrics['n_plus_one'] = repeated
+            logger.warning('N+1 queries in %s: %s', metrics['view'] or request.path,
+                           json.dumps(repeated, separators=(',', ':')))
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(metrics, separators=(',', ':')))
+        app = metrics['total_ms'] - metrics['db_ms'] - metrics['serialize_ms'] - metrics['render_ms']
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={metrics["db_ms"]};desc="{queries.count} queries"',
+            f'serialize;dur={metrics["serialize_ms"]}',
+            f'render;dur={metrics["render_ms"]}',
+            f'app;dur={max(app, 0):.2f}',
+            f'total;dur={metrics["total_ms"]}',
+        ])
+        return response
+
+    def process_template_response(self, request, response):
+        # Template responses render right after this hook, outside the view.
+        start = time.perf_counter()
+
+        def rendered(response):
+            request._store_render_time = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
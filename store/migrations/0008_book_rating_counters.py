@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:29
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_counters(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    db_alias = schema_editor.connection.alias
+    relations = UserBookRelation.objects.using(db_alias).filter(
+        book=OuterRef('pk'), rate__isnull=False).order_by().values('book')
+    Book.objects.using(db_alias).update(
+        rating_sum=Coalesce(Subquery(relations.annotate(total=Sum('rate')).values('total')), 0),
+        rating_count=Coalesce(Subquery(relations.annotate(total=Count('rate')).values('total')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_book_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rating_counters, migrations.RunPython.noop),
+    ]
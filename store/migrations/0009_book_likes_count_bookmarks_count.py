@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    db_alias = schema_editor.connection.alias
+
+    def count(**filters):
+        relations = UserBookRelation.objects.using(db_alias).filter(
+            book=OuterRef('pk'), **filters).order_by().values('book')
+        return Coalesce(Subquery(relations.annotate(total=Count('id')).values('total')), 0)
+
+    Book.objects.using(db_alias).update(likes_count=count(like=True), bookmarks_count=count(in_bookmarks=True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_book_rating_counters'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='book',
+            old_name='rating_count',
+            new_name='ratings_count',
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='bookmarks_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:11
+
+from django.contrib.postgres.search import SearchVectorField
+from django.db import migrations
+
+# The search index as it was at this migration, store.search has moved on since.
+POSTGRES_INSTALL_SQL = (
+    'CREATE INDEX IF NOT EXISTS store_book_search_vector_gin ON store_book USING gin (search_vector)',
+    'DROP TRIGGER IF EXISTS store_book_search_vector_update ON store_book',
+    "CREATE TRIGGER store_book_search_vector_update BEFORE INSERT OR UPDATE OF name, author_name, search_vector "
+    "ON store_book FOR EACH ROW "
+    "EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.simple', name, author_name)",
+    "UPDATE store_book SET search_vector = to_tsvector('pg_catalog.simple', name || ' ' || author_name)",
+)
+
+SQLITE_INSTALL_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS store_book_fts "
+    "USING fts5(name, author_name, content='store_book', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_insert AFTER INSERT ON store_book BEGIN "
+    "INSERT INTO store_book_fts (rowid, name, author_name) VALUES (new.id, new.name, new.author_name); END",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_delete AFTER DELETE ON store_book BEGIN "
+    "INSERT INTO store_book_fts (store_book_fts, rowid, name, author_name) "
+    "VALUES ('delete', old.id, old.name, old.author_name); END",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_update AFTER UPDATE OF name, author_name ON store_book BEGIN "
+    "INSERT INTO store_book_fts (store_book_fts, rowid, name, author_name) "
+    "VALUES ('delete', old.id, old.name, old.author_name); "
+    "INSERT INTO store_book_fts (rowid, name, author_name) VALUES (new.id, new.name, new.author_name); END",
+    "INSERT INTO store_book_fts (store_book_fts) VALUES ('rebuild')",
+)
+
+
+def install_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        statements = POSTGRES_INSTALL_SQL
+    elif schema_editor.connection.vendor == 'sqlite':
+        statements = SQLITE_INSTALL_SQL
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def uninstall_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP TRIGGER IF EXISTS store_book_search_vector_update ON store_book')
+        schema_editor.execute('DROP INDEX IF EXISTS store_book_search_vector_gin')
+    elif schema_editor.connection.vendor == 'sqlite':
+        for trigger in ('store_book_fts_insert', 'store_book_fts_delete', 'store_book_fts_update'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        schema_editor.execute('DROP TABLE IF EXISTS store_book_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_book_likes_count_bookmarks_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
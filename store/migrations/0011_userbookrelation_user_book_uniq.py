@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:40
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_relations(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    db_alias = schema_editor.connection.alias
+    duplicates = UserBookRelation.objects.using(db_alias).values('user', 'book').annotate(
+        last_id=Max('id'), total=Count('id'),
+    ).filter(total__gt=1)
+    book_ids = set()
+    for duplicate in duplicates:
+        UserBookRelation.objects.using(db_alias).filter(user=duplicate['user'], book=duplicate['book']).exclude(
+            id=duplicate['last_id']).delete()
+        book_ids.add(duplicate['book'])
+    if not book_ids:
+        return
+
+    def relations(**filters):
+        return UserBookRelation.objects.using(db_alias).filter(book=OuterRef('pk'), **filters).order_by().values('book')
+
+    def count(**filters):
+        return Coalesce(Subquery(relations(**filters).annotate(total=Count('id')).values('total')), 0)
+
+    Book.objects.using(db_alias).filter(id__in=book_ids).update(
+        likes_count=count(like=True),
+        bookmarks_count=count(in_bookmarks=True),
+        ratings_count=count(rate__isnull=False),
+        rating_sum=Coalesce(Subquery(relations(rate__isnull=False).annotate(total=Sum('rate')).values('total')), 0),
+        rating=Subquery(relations(rate__isnull=False).annotate(total=Avg('rate')).values('total')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_book_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_relations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userbookrelation',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='store_userbookrelation_user_book_uniq'),
+        ),
+    ]
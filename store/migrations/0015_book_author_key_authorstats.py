@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:12
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def normalize_author_name(name):
+    return ' '.join(name.split()).casefold()
+
+
+def fill_author_stats(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    AuthorStats = apps.get_model('store', 'AuthorStats')
+    db_alias = schema_editor.connection.alias
+    books = [Book(id=id, author_key=normalize_author_name(author_name))
+             for id, author_name in Book.objects.using(db_alias).values_list('id', 'author_name')]
+    Book.objects.using(db_alias).bulk_update(books, ['author_key'], batch_size=1000)
+    stats = Book.objects.using(db_alias).order_by().values('author_key').annotate(
+        author_name=Min('author_name'), books_count=Count('id'), price_sum=Sum('price'),
+        likes_count=Sum('likes_count'), ratings_count=Sum('ratings_count'), rating_sum=Sum('rating_sum'),
+    )
+    AuthorStats.objects.using(db_alias).bulk_create([AuthorStats(**row) for row in stats], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_book_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='author_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author_key', models.CharField(max_length=255, unique=True)),
+                ('author_name', models.CharField(max_length=255)),
+                ('books_count', models.PositiveIntegerField(default=0)),
+                ('price_sum', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('likes_count', models.PositiveIntegerField(default=0)),
+                ('ratings_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'author stats',
+            },
+        ),
+        migrations.RunPython(fill_author_stats, migrations.RunPython.noop),
+    ]
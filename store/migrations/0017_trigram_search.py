@@ -0,0 +1,88 @@
+from django.db import migrations
+
+# The search index as it was at this migration, store.search may move on.
+POSTGRES_INSTALL_SQL = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS store_book_name_trgm ON store_book USING gin (name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS store_book_author_name_trgm ON store_book USING gin (author_name gin_trgm_ops)',
+)
+
+POSTGRES_UNINSTALL_SQL = (
+    'DROP INDEX IF EXISTS store_book_name_trgm',
+    'DROP INDEX IF EXISTS store_book_author_name_trgm',
+)
+
+SQLITE_INSTALL_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS store_book_fts "
+    "USING fts5(name, author_name, content='store_book', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_insert AFTER INSERT ON store_book BEGIN "
+    "INSERT INTO store_book_fts (rowid, name, author_name) VALUES (new.id, new.name, new.author_name); END",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_delete AFTER DELETE ON store_book BEGIN "
+    "INSERT INTO store_book_fts (store_book_fts, rowid, name, author_name) "
+    "VALUES ('delete', old.id, old.name, old.author_name); END",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_update AFTER UPDATE OF name, author_name ON store_book BEGIN "
+    "INSERT INTO store_book_fts (store_book_fts, rowid, name, author_name) "
+    "VALUES ('delete', old.id, old.name, old.author_name); "
+    "INSERT INTO store_book_fts (rowid, name, author_name) VALUES (new.id, new.name, new.author_name); END",
+    "INSERT INTO store_book_fts (store_book_fts) VALUES ('rebuild')",
+)
+
+SQLITE_UNINSTALL_SQL = (
+    'DROP TRIGGER IF EXISTS store_book_fts_insert',
+    'DROP TRIGGER IF EXISTS store_book_fts_delete',
+    'DROP TRIGGER IF EXISTS store_book_fts_update',
+    'DROP TABLE IF EXISTS store_book_fts',
+)
+
+
+def drop_search_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP TRIGGER IF EXISTS store_book_search_vector_update ON store_book')
+        schema_editor.execute('DROP INDEX IF EXISTS store_book_search_vector_gin')
+    elif schema_editor.connection.vendor == 'sqlite':
+        # The word-tokenized FTS5 table is replaced by a trigram one.
+        for statement in SQLITE_UNINSTALL_SQL:
+            schema_editor.execute(statement)
+
+
+def install_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                # Search works unindexed without the extension.
+                return
+        statements = POSTGRES_INSTALL_SQL
+    elif schema_editor.connection.vendor == 'sqlite':
+        statements = SQLITE_INSTALL_SQL
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def uninstall_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        statements = POSTGRES_UNINSTALL_SQL
+    elif schema_editor.connection.vendor == 'sqlite':
+        statements = SQLITE_UNINSTALL_SQL
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_vector_index, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='book',
+            name='search_vector',
+        ),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -1,18 +1,67 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+
+
+def normalize_author_name(name):
+    """Key of an author, so case and stray whitespace don't split the stats of one author."""
+    return ' '.join(name.split()).casefold()
 
 
 class Book(models.Model):
     name = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=7, decimal_places=2)
     author_name = models.CharField(max_length=255)
+    author_key = models.CharField(max_length=255, editable=False, db_index=True)
     owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='my_books')
     readers = models.ManyToManyField(User, through='UserBookRelation', related_name='books')
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=None, null=True)
+    rating_sum = models.PositiveIntegerField(default=0)
+    ratings_count = models.PositiveIntegerField(default=0)
+    likes_count = models.PositiveIntegerField(default=0)
+    bookmarks_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='store_book_name_idx'),
+            models.Index(fields=['price', 'id'], name='store_book_price_id_idx'),
+            models.Index(fields=['author_name', 'id'], name='store_book_author_name_id_idx'),
+            models.Index(fields=['-rating', '-id'], condition=models.Q(rating__isnull=False),
+                         name='store_book_rating_id_idx'),
+            models.Index(fields=['-likes_count', '-id'], name='store_book_likes_count_id_idx'),
+            models.Index(fields=['-bookmarks_count', '-id'], name='store_book_bookmarks_id_idx'),
+        ]
+
+    # Author stats move when any of these change.
+    author_stats_fields = {'author_name', 'price', 'likes_count', 'ratings_count', 'rating_sum'}
+    old_author_key = None
 
     def __str__(self):
         return f'{self.name} by {self.author_name}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        book = super().from_db(db, field_names, values)
+        book.old_author_key = book.__dict__.get('author_key')
+        return book
+
+    def save(self, *args, **kwargs):
+        from store.logic import refresh_author_stats
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not self.author_stats_fields & set(update_fields):
+            return super().save(*args, **kwargs)
+        if update_fields is None or 'author_name' in update_fields:
+            self.author_key = normalize_author_name(self.author_name)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'author_key'}
+        old_author_key = self.old_author_key
+        if old_author_key is None and self.pk is not None and not self._state.adding:
+            old_author_key = Book.objects.filter(pk=self.pk).values_list('author_key', flat=True).first()
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            refresh_author_stats({self.author_key, old_author_key} - {None})
+        self.old_author_key = self.author_key
+
 
 class UserBookRelation(models.Model):
     RATE_CHOICES = (
@@ -28,10 +77,82 @@ class UserBookRelation(models.Model):
     in_bookmarks = models.BooleanField(default=False)
     rate = models.PositiveSmallIntegerField(choices=RATE_CHOICES, null=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='store_userbookrelation_user_book_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['book'], condition=models.Q(like=True), name='store_ubr_book_liked_idx'),
+            models.Index(fields=['book'], condition=models.Q(in_bookmarks=True), name='store_ubr_book_bookmarked_idx'),
+            models.Index(fields=['book', 'rate'], condition=models.Q(rate__isnull=False), name='store_ubr_book_rated_idx'),
+        ]
+
     def __str__(self):
         return f'{self.user.username}: {self.book}, RATE: {self.rate}'
 
+    state_fields = ('like', 'in_bookmarks', 'rate')
+    # The stored (like, in_bookmarks, rate), None until known.
+    old_state = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        relation = super().from_db(db, field_names, values)
+        # Only what was loaded: reading a deferred field here would load another instance, and so on.
+        relation.old_state = relation.loaded_state()
+        return relation
+
+    @property
+    def state(self):
+        return self.like, self.in_bookmarks, self.rate
+
+    def loaded_state(self):
+        if any(field not in self.__dict__ for field in self.state_fields):
+            return None
+        return self.state
+
+    def stored_state(self):
+        if self.old_state is None and self.pk is not None:
+            return UserBookRelation.objects.filter(pk=self.pk).values_list(*self.state_fields).first()
+        return self.old_state
+
     def save(self, *args, **kwargs):
-        from store.logic import set_rating
-        super().save(*args, **kwargs)
-        set_rating(self.book)
+        from store.logic import record_relation_change
+        old_state = self.stored_state()
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            record_relation_change(self.book_id, old_state, self.state)
+        self.old_state = self.state
+
+    def delete(self, *args, **kwargs):
+        # store.signals applies the counter change on post_delete, which queryset and cascade deletes send too.
+        self.old_state = self.stored_state()
+        return super().delete(*args, **kwargs)
+
+
+class DirtyBook(models.Model):
+    """A pending recompute of the counters of book, queued when STORE_COUNTERS_MODE is 'deferred'."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Book {self.book_id} dirty since {self.created_at}'
+
+
+class AuthorStats(models.Model):
+    """
+    Aggregates of the books of an author, kept in step with Book and its counters by store.logic so leaderboards
+    read one row per author instead of grouping the catalog.
+    """
+    author_key = models.CharField(max_length=255, unique=True)
+    author_name = models.CharField(max_length=255)
+    books_count = models.PositiveIntegerField(default=0)
+    price_sum = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    likes_count = models.PositiveIntegerField(default=0)
+    ratings_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'author stats'
+
+    def __str__(self):
+        return f'{self.author_name}: {self.books_count} books'
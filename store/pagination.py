@@ -0,0 +1,155 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, CursorPagination, LimitOffsetPagination, _reverse_ordering
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class BookCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'id'
+
+    def get_page_size(self, request):
+        # Pagination is opt-in: plain list requests keep returning every book.
+        if self.cursor_query_param not in request.query_params and \
+                self.page_size_query_param not in request.query_params:
+            return None
+        return super().get_page_size(request)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(OrderingFilter().get_ordering(request, queryset, view) or (self.ordering,))
+        if 'id' not in ordering and '-id' not in ordering:
+            # Follow the direction of the first field so (field, id) indexes can serve the scan.
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # DRF filters on the first ordering field only and skips its ties by an offset capped at offset_cutoff, so
+        # a page inside a long run of equal prices linked back to itself. The position here holds the values of every
+        # ordering field of the last row, id included, and the next page seeks past that row.
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, position = self.cursor or (0, False, None)
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.seek(queryset, ordering, position))
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        following = self._get_position_from_instance(results[-1], self.ordering) \
+            if len(results) > self.page_size else None
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.next_position = True, position
+            self.has_previous, self.previous_position = following is not None, following
+        else:
+            self.has_next, self.next_position = following is not None, following
+            self.has_previous, self.previous_position = position is not None or offset > 0, position
+        self.display_page_controls = self.has_previous or self.has_next
+        return self.page
+
+    def seek(self, queryset, ordering, position):
+        """Return the filter of the rows after position in ordering: (a, b) > (x, y) as a > x OR (a = x AND b > y)."""
+        try:
+            values = json.loads(position)
+            fields = [field.lstrip('-') for field in ordering]
+            values = [queryset.model._meta.get_field(field).to_python(value) for field, value in zip(fields, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(values) != len(fields):
+            raise NotFound(self.invalid_cursor_message)
+        seek = Q()
+        for i, order in enumerate(ordering):
+            lookup = 'lt' if order.startswith('-') else 'gt'
+            seek |= Q(**dict(zip(fields[:i], values[:i])), **{f'{fields[i]}__{lookup}': values[i]})
+        return seek
+
+    def _get_position_from_instance(self, instance, ordering):
+        fields = [field.lstrip('-') for field in ordering]
+        values = [instance[field] if isinstance(instance, dict) else getattr(instance, field) for field in fields]
+        return json.dumps([str(value) for value in values], separators=(',', ':'))
+
+
+class ReaderCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'id'
+
+
+class AuthorStatsPagination(LimitOffsetPagination):
+    # Leaderboards are ordered by averages that can be null, which cursors can't page through.
+    default_limit = 20
+    max_limit = 100
+
+
+class FeedPagination(BasePagination):
+    """
+    Keyset pagination of a feed ordered by (view.feed_field, id) descending. The cursor holds the last row's pair,
+    so every page is an index seek of page_size rows, however deep the client pages.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.field = view.feed_field
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(queryset, request)
+        ordered = queryset.order_by(f'-{self.field}', '-id')
+        if cursor is None:
+            rows = list(ordered[:page_size + 1])
+        else:
+            # Rows tied with the cursor, then the rows below it: two exact seeks where an OR of both would scan
+            # through the ties.
+            value, book_id = cursor
+            rows = list(ordered.filter(**{self.field: value, 'id__lt': book_id})[:page_size + 1])
+            if len(rows) <= page_size:
+                rows += ordered.filter(**{f'{self.field}__lt': value})[:page_size + 1 - len(rows)]
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(page_size, self.max_page_size) if page_size > 0 else self.page_size
+
+    def decode_cursor(self, queryset, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            value, book_id = urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            return queryset.model._meta.get_field(self.field).to_python(value), int(book_id)
+        except (TypeError, ValueError, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        value, book_id = ((last[self.field], last['id']) if isinstance(last, dict) else
+                          (getattr(last, self.field), last.id))
+        cursor = urlsafe_b64encode(f'{value}|{book_id}'.encode('ascii')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([('next', self.get_next_link()), ('results', data)]))
@@ -3,8 +3,18 @@ from rest_framework.permissions import BasePermission, SAFE_METHODS
 
 class IsOwnerOrStaffOrReadOnly(BasePermission):
     def has_object_permission(self, request, view, obj):
+        # owner_id is on the row already, comparing owners would load the owner.
         return bool(
             request.method in SAFE_METHODS or
             request.user and
-            request.user.is_authenticated and (obj.owner == request.user or request.user.is_staff)
+            request.user.is_authenticated and (obj.owner_id == request.user.pk or request.user.is_staff)
         )
+
+    @staticmethod
+    def scope_queryset(request, queryset):
+        """Restrict queryset to the objects request may change, so other users' objects are never fetched."""
+        if request.method in SAFE_METHODS or request.user.is_staff:
+            return queryset
+        if not request.user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(owner_id=request.user.pk)
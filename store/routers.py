@@ -0,0 +1,106 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_primary_pinned = ContextVar('store_primary_pinned', default=False)
+_replica = ContextVar('store_replica', default=None)
+# Whether the current request wrote, each write restarts the client's sticky period.
+_primary_written = ContextVar('store_primary_written', default=False)
+
+
+def pin_primary():
+    """Send the rest of the current request's reads to the primary, e.g. after a write."""
+    _primary_pinned.set(True)
+
+
+def primary_pinned():
+    return _primary_pinned.get()
+
+
+class PrimaryReplicaRouter:
+    """
+    Route reads of the store app to one of settings.STORE_DATABASE_REPLICAS and writes to the primary.
+
+    A write pins the primary for the rest of the request so it reads its own writes, as do reads in a transaction.
+    One replica is used for a whole request, so its queries see a consistent snapshot.
+    """
+    route_app_labels = {'store'}
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in self.route_app_labels:
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        replicas = getattr(settings, 'STORE_DATABASE_REPLICAS', [])
+        if not replicas or primary_pinned() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replica = _replica.get()
+        if replica is None:
+            replica = random.choice(replicas)
+        return replica
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in self.route_app_labels:
+            return None
+        pin_primary()
+        _primary_written.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *getattr(settings, 'STORE_DATABASE_REPLICAS', [])}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """
+    Scope the router's primary pin to a request. Unsafe requests start pinned, and a client that wrote keeps
+    reading from the primary for STORE_REPLICA_STICKY_SECONDS after its last write through a cookie, covering
+    replication lag.
+    """
+    cookie_name = 'store_primary'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self.pin(request)
+        try:
+            return self.stick(self.get_response(request))
+        finally:
+            self.unpin(tokens)
+
+    async def __acall__(self, request):
+        # sync_to_async runs the ORM in a copy of this context and copies the router's pins back.
+        tokens = self.pin(request)
+        try:
+            return self.stick(await self.get_response(request))
+        finally:
+            self.unpin(tokens)
+
+    def pin(self, request):
+        replicas = getattr(settings, 'STORE_DATABASE_REPLICAS', [])
+        unsafe = request.method not in ('GET', 'HEAD', 'OPTIONS')
+        return (_primary_pinned.set(unsafe or self.cookie_name in request.COOKIES), _primary_written.set(unsafe),
+                _replica.set(random.choice(replicas) if replicas else None))
+
+    def unpin(self, tokens):
+        for var, token in zip((_primary_pinned, _primary_written, _replica), tokens):
+            var.reset(token)
+
+    def stick(self, response):
+        if getattr(settings, 'STORE_DATABASE_REPLICAS', []) and _primary_written.get():
+            max_age = getattr(settings, 'STORE_REPLICA_STICKY_SECONDS', 5)
+            response.set_cookie(self.cookie_name, '1', max_age=max_age, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,124 @@
+import operator
+from functools import reduce
+
+from django.db import connections
+from django.db.models import Case, F, Lookup, Value, When
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+# pg_trgm GIN indexes serve the unanchored ILIKE of ?search=. Without the extension search still works, unindexed.
+POSTGRES_INSTALL_SQL = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS store_book_name_trgm ON store_book USING gin (name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS store_book_author_name_trgm ON store_book USING gin (author_name gin_trgm_ops)',
+)
+
+POSTGRES_UNINSTALL_SQL = (
+    'DROP INDEX IF EXISTS store_book_name_trgm',
+    'DROP INDEX IF EXISTS store_book_author_name_trgm',
+)
+
+# The trigram tokenizer makes a quoted FTS5 phrase match anywhere inside a column, like icontains.
+SQLITE_INSTALL_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS store_book_fts "
+    "USING fts5(name, author_name, content='store_book', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_insert AFTER INSERT ON store_book BEGIN "
+    "INSERT INTO store_book_fts (rowid, name, author_name) VALUES (new.id, new.name, new.author_name); END",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_delete AFTER DELETE ON store_book BEGIN "
+    "INSERT INTO store_book_fts (store_book_fts, rowid, name, author_name) "
+    "VALUES ('delete', old.id, old.name, old.author_name); END",
+    "CREATE TRIGGER IF NOT EXISTS store_book_fts_update AFTER UPDATE OF name, author_name ON store_book BEGIN "
+    "INSERT INTO store_book_fts (store_book_fts, rowid, name, author_name) "
+    "VALUES ('delete', old.id, old.name, old.author_name); "
+    "INSERT INTO store_book_fts (rowid, name, author_name) VALUES (new.id, new.name, new.author_name); END",
+    "INSERT INTO store_book_fts (store_book_fts) VALUES ('rebuild')",
+)
+
+SQLITE_TRIGGERS = ('store_book_fts_insert', 'store_book_fts_delete', 'store_book_fts_update')
+
+
+def install_search_index(connection):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                return
+        statements = POSTGRES_INSTALL_SQL
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'store_book'")
+            if set(SQLITE_TRIGGERS) <= {row[0] for row in cursor.fetchall()}:
+                return
+        # SQLite drops triggers whenever a migration rebuilds store_book, so this also runs after migrate.
+        statements = SQLITE_INSTALL_SQL
+    else:
+        return
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def uninstall_search_index(connection):
+    if connection.vendor == 'postgresql':
+        statements = POSTGRES_UNINSTALL_SQL
+    elif connection.vendor == 'sqlite':
+        statements = [f'DROP TRIGGER IF EXISTS {trigger}' for trigger in SQLITE_TRIGGERS]
+        statements.append('DROP TABLE IF EXISTS store_book_fts')
+    else:
+        return
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class ILike(Lookup):
+    """Case-insensitive LIKE on the bare column, the form a pg_trgm index on the column serves."""
+    lookup_name = 'ilike'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} ILIKE {rhs}', [*lhs_params, *rhs_params]
+
+
+class PostgresSearchBackend:
+    def search(self, queryset, terms, search_fields):
+        connection = connections[queryset.db]
+        matches = [[ILike(F(field), f'%{connection.ops.prep_for_like_query(term)}%') for field in search_fields]
+                   for term in terms]
+        for term_matches in matches:
+            queryset = queryset.filter(reduce(operator.or_, term_matches))
+        # Rank by how many of the fields match each term.
+        rank = sum((Case(When(match, then=Value(1)), default=Value(0)) for term_matches in matches
+                    for match in term_matches), Value(0))
+        return queryset.annotate(search_rank=rank).order_by('-search_rank', 'id')
+
+
+class SQLiteSearchBackend:
+    def search(self, queryset, terms, search_fields):
+        match = ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+        return queryset.filter(
+            id__in=RawSQL('SELECT rowid FROM store_book_fts WHERE store_book_fts MATCH %s', (match,)),
+        ).annotate(
+            search_rank=RawSQL('SELECT -bm25(store_book_fts) FROM store_book_fts '
+                               'WHERE store_book_fts MATCH %s AND rowid = store_book.id', (match,)),
+        ).order_by('-search_rank', 'id')
+
+
+class BookSearchFilter(SearchFilter):
+    """
+    ?search= with SearchFilter's contract, every term a case-insensitive substring of one of the search fields,
+    served by a trigram index and ranked. Trigram indexes need three characters, shorter terms use SearchFilter.
+    """
+    backends = {
+        'postgresql': PostgresSearchBackend,
+        'sqlite': SQLiteSearchBackend,
+    }
+    min_term_length = 3
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        backend = self.backends.get(connections[queryset.db].vendor)
+        if not terms or backend is None or min(map(len, terms)) < self.min_term_length:
+            return super().filter_queryset(request, queryset, view)
+        return backend().search(queryset, terms, self.get_search_fields(view, request))
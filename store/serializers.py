@@ -1,8 +1,16 @@
+from collections import defaultdict
+
 from django.contrib.auth.models import User
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 
-from store.models import Book, UserBookRelation
+from store.middleware import serialization_timer
+from store.models import AuthorStats, Book, UserBookRelation
+
+# The largest id a bigint primary key holds, a larger one would fail in the database instead of in validation.
+MAX_ID = 2 ** 63 - 1
 
 
 class BookReaderSerializer(ModelSerializer):
@@ -11,18 +19,156 @@ class BookReaderSerializer(ModelSerializer):
         fields = ('first_name', 'last_name', 'email')
 
 
-class BookSerializer(ModelSerializer):
+class BookReadersSerializer(serializers.ListSerializer):
+    def get_attribute(self, instance):
+        # BookViewSet prefetches a bounded sample into sampled_readers when ?readers_limit= is given.
+        readers = getattr(instance, 'sampled_readers', None)
+        if readers is None:
+            readers = instance.readers.all()
+        return readers
+
+
+class SerializationTimingMixin:
+    # Counted where the data is first built, nested serializers run inside it.
+    @property
+    def data(self):
+        with serialization_timer(self.context.get('request')):
+            return super().data
+
+
+class BookListSerializer(SerializationTimingMixin, serializers.ListSerializer):
+    pass
+
+
+class BookSerializer(SerializationTimingMixin, ModelSerializer):
     likes_count = serializers.IntegerField(read_only=True)
+    bookmarks_count = serializers.IntegerField(read_only=True)
+    ratings_count = serializers.IntegerField(read_only=True)
     rating = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
     owner_name = serializers.CharField(default='', read_only=True)
-    readers = BookReaderSerializer(many=True, read_only=True)
+    my_like = serializers.BooleanField(default=False, read_only=True)
+    my_in_bookmarks = serializers.BooleanField(default=False, read_only=True)
+    my_rate = serializers.IntegerField(default=None, allow_null=True, read_only=True)
+    readers = BookReadersSerializer(child=BookReaderSerializer(), read_only=True)
 
     class Meta:
         model = Book
-        fields = ('id', 'name', 'price', 'author_name', 'likes_count', 'rating', 'owner_name', 'readers')
+        fields = ('id', 'name', 'price', 'author_name', 'likes_count', 'bookmarks_count', 'ratings_count', 'rating',
+                  'owner_name', 'my_like', 'my_in_bookmarks', 'my_rate', 'readers')
+        list_serializer_class = BookListSerializer
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field in set(self.fields) - set(fields):
+                self.fields.pop(field)
+
+
+BOOK_USER_RELATION_FIELDS = ('my_like', 'my_in_bookmarks', 'my_rate')
+BOOK_VALUES_FIELDS = ('id', 'name', 'price', 'author_name', 'likes_count', 'bookmarks_count', 'ratings_count',
+                      'rating', 'owner_name', *BOOK_USER_RELATION_FIELDS)
+BOOK_READER_FIELDS = ('first_name', 'last_name', 'email')
+
+
+def book_readers_values(book_ids, readers_limit=None):
+    relations = UserBookRelation.objects.filter(book_id__in=book_ids).order_by('book_id', 'user_id')
+    if readers_limit is not None:
+        relations = relations.annotate(
+            reader_number=Window(RowNumber(), partition_by=F('book_id'), order_by=F('user_id').asc()),
+        ).filter(reader_number__lte=readers_limit)
+    return relations.values_list('book_id', *(f'user__{field}' for field in BOOK_READER_FIELDS))
+
+
+def format_book_values(rows, readers, fields=None):
+    price_field = serializers.DecimalField(max_digits=7, decimal_places=2)
+    rating_field = BookSerializer._declared_fields['rating']
+    if fields is not None:
+        formatters = {
+            'price': price_field.to_representation,
+            'rating': lambda rating: None if rating is None else rating_field.to_representation(rating),
+        }
+        return [
+            {field: readers[row['id']] if field == 'readers' else formatters.get(field, lambda value: value)(row[field])
+             for field in fields}
+            for row in rows
+        ]
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'price': price_field.to_representation(row['price']),
+            'author_name': row['author_name'],
+            'likes_count': row['likes_count'],
+            'bookmarks_count': row['bookmarks_count'],
+            'ratings_count': row['ratings_count'],
+            'rating': None if row['rating'] is None else rating_field.to_representation(row['rating']),
+            'owner_name': row['owner_name'],
+            'my_like': row['my_like'],
+            'my_in_bookmarks': row['my_in_bookmarks'],
+            'my_rate': row['my_rate'],
+            'readers': readers[row['id']],
+        }
+        for row in rows
+    ]
+
+
+def book_values_data(rows, readers_limit=None, fields=None):
+    """
+    Build BookSerializer output, restricted to fields when given, from rows of Book.objects.values() without
+    serializer fields.
+    """
+    readers = defaultdict(list)
+    if fields is None or 'readers' in fields:
+        for book_id, *values in book_readers_values([row['id'] for row in rows], readers_limit):
+            readers[book_id].append(dict(zip(BOOK_READER_FIELDS, values)))
+    return format_book_values(rows, readers, fields)
+
+
+async def abook_values_data(rows, readers_limit=None, fields=None):
+    readers = defaultdict(list)
+    if fields is None or 'readers' in fields:
+        async for book_id, *values in book_readers_values([row['id'] for row in rows], readers_limit):
+            readers[book_id].append(dict(zip(BOOK_READER_FIELDS, values)))
+    return format_book_values(rows, readers, fields)
+
+
+BOOK_BULK_FIELDS = ('id', 'name', 'price', 'author_name')
+
+
+def book_bulk_ids(items):
+    """Validate the book ids of bulk items, returns (ids, errors) aligned with items, ids are None where invalid."""
+    id_field = serializers.IntegerField(min_value=1, max_value=MAX_ID)
+    ids, errors, seen = [], [], set()
+    for item in items:
+        try:
+            book_id = id_field.run_validation(item)
+        except serializers.ValidationError as error:
+            book_id, item_errors = None, {'id': error.detail}
+        else:
+            item_errors = {'id': ['Duplicate id.']} if book_id in seen else {}
+            seen.add(book_id)
+        ids.append(None if item_errors else book_id)
+        errors.append(item_errors)
+    return ids, errors
 
 
 class UserBookRelationSerializer(ModelSerializer):
     class Meta:
         model = UserBookRelation
         fields = ('book', 'like', 'in_bookmarks', 'rate')
+
+
+class UserBookRelationBulkSerializer(serializers.Serializer):
+    book = serializers.IntegerField(min_value=1, max_value=MAX_ID)
+    like = serializers.BooleanField(required=False)
+    in_bookmarks = serializers.BooleanField(required=False)
+    rate = serializers.ChoiceField(choices=UserBookRelation.RATE_CHOICES, required=False, allow_null=True)
+
+
+class AuthorStatsSerializer(ModelSerializer):
+    average_price = serializers.DecimalField(max_digits=7, decimal_places=2, read_only=True)
+    average_rating = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = AuthorStats
+        fields = ('author_name', 'books_count', 'average_price', 'average_rating', 'likes_count', 'ratings_count')
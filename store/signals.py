@@ -0,0 +1,56 @@
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+
+from store.cache import bump_book_version, bump_book_versions
+from store.logic import record_relation_change, refresh_author_stats
+from store.models import Book, UserBookRelation
+from store.serializers import BOOK_READER_FIELDS
+
+# The user fields books show, as owner_name and in readers.
+BOOK_USER_FIELDS = {'username', *BOOK_READER_FIELDS}
+from store.search import install_search_index
+
+
+@receiver([post_save, post_delete], sender=Book)
+def invalidate_book(sender, instance, **kwargs):
+    bump_book_version(instance.pk)
+
+
+@receiver(post_delete, sender=Book)
+def remove_book_from_author_stats(sender, instance, **kwargs):
+    # Sent for queryset deletes too, the admin's bulk delete among them.
+    refresh_author_stats([instance.author_key])
+
+
+@receiver([post_save, post_delete], sender=UserBookRelation)
+def invalidate_book_relation(sender, instance, **kwargs):
+    bump_book_version(instance.book_id)
+
+
+@receiver(post_delete, sender=UserBookRelation)
+def remove_relation_from_counters(sender, instance, origin=None, **kwargs):
+    # The counters of a book that is being deleted go with it.
+    if isinstance(origin, Book) or getattr(origin, 'model', None) is Book:
+        return
+    record_relation_change(instance.book_id, instance.old_state, None)
+
+
+@receiver(post_save, sender=User)
+@receiver(pre_delete, sender=User)
+def invalidate_user_books(sender, instance, created=False, update_fields=None, **kwargs):
+    # Before the delete, which sets the owner of the user's books to NULL without a signal. A login only saves
+    # last_login.
+    if created or (update_fields is not None and not BOOK_USER_FIELDS & set(update_fields)):
+        return
+    book_ids = {*Book.objects.filter(owner=instance).values_list('id', flat=True),
+                *UserBookRelation.objects.filter(user=instance).values_list('book_id', flat=True)}
+    if book_ids:
+        bump_book_versions(book_ids)
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using, **kwargs):
+    if sender.name == 'store':
+        install_search_index(connections[using])
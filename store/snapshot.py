@@ -0,0 +1,200 @@
+"""
+Columnar snapshot of the catalog for in-process analytics.
+
+The snapshot is one file: a JSON header followed by one contiguous block per column, so every column memory-maps
+as a NumPy array without reading the file. Prices are stored in cents, ratings as float32 with NaN for unrated
+books, and authors as codes into the header's list of author keys.
+"""
+import json
+import os
+import struct
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from store.models import Book
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+MAGIC = b'BOOKSNAP'
+VERSION = 1
+ALIGNMENT = 64
+COLUMNS = (
+    ('id', '<i8'),
+    ('price_cents', '<i4'),
+    ('rating', '<f4'),
+    ('likes_count', '<i4'),
+    ('author', '<i4'),
+)
+# Rows written by transactions still open when the previous snapshot read the catalog carry an updated_at before
+# its start, so incremental updates look back STORE_SNAPSHOT_OVERLAP_SECONDS. New books are also found by id, but a
+# change to an existing book committed longer than that after it was stamped is only picked up by a full rebuild.
+DEFAULT_OVERLAP_SECONDS = 60
+
+
+def _require_numpy():
+    if np is None:
+        raise ImproperlyConfigured('Book snapshots require numpy.')
+
+
+def default_path():
+    return getattr(settings, 'STORE_SNAPSHOT_PATH', os.path.join(settings.BASE_DIR, 'books.snapshot'))
+
+
+class BookSnapshot:
+    def __init__(self, columns, authors, built_at):
+        self.columns = columns
+        self.authors = authors
+        self.built_at = built_at
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    @classmethod
+    def load(cls, path=None):
+        """Map the snapshot at path; columns are read-only views of the file."""
+        _require_numpy()
+        path = path or default_path()
+        with open(path, 'rb') as snapshot:
+            magic, header_size = struct.unpack('<8sI', snapshot.read(12))
+            if magic != MAGIC:
+                raise ValueError(f'{path} is not a book snapshot.')
+            header = json.loads(snapshot.read(header_size))
+        if header['version'] != VERSION:
+            raise ValueError(f'{path} has snapshot version {header["version"]}, expected {VERSION}.')
+        columns = {
+            name: (np.memmap(path, dtype=dtype, mode='r', offset=header['offsets'][name], shape=(header['count'],))
+                   if header['count'] else np.empty(0, dtype=dtype))
+            for name, dtype in COLUMNS
+        }
+        return cls(columns, header['authors'], datetime.fromisoformat(header['built_at']))
+
+    def save(self, path=None):
+        """Write the snapshot next to path and move it into place, so readers never see a partial file."""
+        path = path or default_path()
+        count = len(self)
+        header = {'version': VERSION, 'count': count, 'built_at': self.built_at.isoformat(), 'authors': self.authors}
+        # The offsets depend on the header size, which depends on the offsets: reserve room for them first.
+        header['offsets'] = dict.fromkeys(self.columns, 10 ** 15)
+        offset = 12 + len(json.dumps(header).encode())
+        for name, dtype in COLUMNS:
+            offset += -offset % ALIGNMENT
+            header['offsets'][name] = offset
+            offset += count * np.dtype(dtype).itemsize
+        encoded = json.dumps(header).encode()
+        encoded += b' ' * (header['offsets'][COLUMNS[0][0]] - 12 - len(encoded))
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as snapshot:
+            snapshot.write(struct.pack('<8sI', MAGIC, len(encoded)) + encoded)
+            for name, dtype in COLUMNS:
+                snapshot.write(b'\0' * (header['offsets'][name] - snapshot.tell()))
+                snapshot.write(np.ascontiguousarray(self.columns[name], dtype=dtype).tobytes())
+        os.replace(temporary, path)
+
+    @property
+    def price(self):
+        return self.columns['price_cents'] / 100
+
+    def _values(self, column, where):
+        values = self.price if column == 'price' else self.columns[column]
+        return values if where is None else values[where]
+
+    def histogram(self, column, bins=10, range=None, where=None):
+        """Return (counts, bin_edges) of column, skipping unrated books for rating."""
+        values = self._values(column, where)
+        return np.histogram(values[~np.isnan(values)] if column == 'rating' else values, bins=bins, range=range)
+
+    def percentiles(self, column, q, where=None):
+        values = self._values(column, where)
+        if not len(values):
+            return np.full(np.shape(q), np.nan)
+        return np.nanpercentile(values, q)
+
+    def author_means(self, column, where=None):
+        """Return {author_key: mean of column}, skipping unrated books for rating."""
+        values = self._values(column, where).astype('f8')
+        authors = self.columns['author'] if where is None else self.columns['author'][where]
+        present = ~np.isnan(values)
+        sums = np.bincount(authors[present], weights=values[present], minlength=len(self.authors))
+        counts = np.bincount(authors[present], minlength=len(self.authors))
+        return {self.authors[code]: sums[code] / counts[code] for code in np.flatnonzero(counts)}
+
+
+def _read_books(books, authors, chunk_size):
+    """Read books into column arrays, adding unseen author keys to authors."""
+    codes = {author: code for code, author in enumerate(authors)}
+    rows = books.order_by('id').values_list('id', 'price', 'rating', 'likes_count', 'author_key')
+    chunks = {name: [] for name, _ in COLUMNS}
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            _add_chunk(chunks, chunk, codes, authors)
+            chunk = []
+    _add_chunk(chunks, chunk, codes, authors)
+    return {name: np.concatenate(chunks[name]) if chunks[name] else np.empty(0, dtype=dtype)
+            for name, dtype in COLUMNS}
+
+
+def _add_chunk(chunks, chunk, codes, authors):
+    if not chunk:
+        return
+    for _, _, _, _, author_key in chunk:
+        if author_key not in codes:
+            codes[author_key] = len(authors)
+            authors.append(author_key)
+    chunks['id'].append(np.fromiter((row[0] for row in chunk), '<i8', len(chunk)))
+    chunks['price_cents'].append(np.fromiter((round(row[1] * 100) for row in chunk), '<i4', len(chunk)))
+    chunks['rating'].append(np.fromiter((np.nan if row[2] is None else row[2] for row in chunk), '<f4',
+                                        len(chunk)))
+    chunks['likes_count'].append(np.fromiter((row[3] for row in chunk), '<i4', len(chunk)))
+    chunks['author'].append(np.fromiter((codes[row[4]] for row in chunk), '<i4', len(chunk)))
+
+
+def build_snapshot(path=None, chunk_size=10000):
+    """Write a snapshot of every book to path, returns it."""
+    _require_numpy()
+    built_at = timezone.now()
+    authors = []
+    snapshot = BookSnapshot(_read_books(Book.objects.all(), authors, chunk_size), authors, built_at)
+    snapshot.save(path)
+    return snapshot
+
+
+def update_snapshot(path=None, chunk_size=10000):
+    """
+    Bring the snapshot at path up to date from the books updated since it was built and the ids of deleted books,
+    returns (snapshot, changed, deleted). Author codes stay stable, new authors are appended.
+    """
+    _require_numpy()
+    previous = BookSnapshot.load(path)
+    built_at = timezone.now()
+    authors = list(previous.authors)
+    overlap = timedelta(seconds=getattr(settings, 'STORE_SNAPSHOT_OVERLAP_SECONDS', DEFAULT_OVERLAP_SECONDS))
+    changed = _read_books(Book.objects.filter(updated_at__gte=previous.built_at - overlap), authors, chunk_size)
+    ids = np.fromiter(Book.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size),
+                      '<i8')
+    # Books inserted by a transaction that committed after the overlap, like a long import.
+    missing = np.setdiff1d(ids, np.concatenate([previous.id, changed['id']]))
+    for start in range(0, len(missing), chunk_size):
+        late = _read_books(Book.objects.filter(id__in=missing[start:start + chunk_size].tolist()), authors,
+                           chunk_size)
+        changed = {name: np.concatenate([changed[name], late[name]]) for name, _ in COLUMNS}
+    keep = np.isin(previous.id, ids) & ~np.isin(previous.id, changed['id'])
+    deleted = int(np.count_nonzero(~np.isin(previous.id, ids)))
+    columns = {name: np.concatenate([np.asarray(previous.columns[name])[keep], changed[name]]) for name, _ in COLUMNS}
+    order = np.argsort(columns['id'], kind='stable')
+    snapshot = BookSnapshot({name: values[order] for name, values in columns.items()}, authors, built_at)
+    snapshot.save(path)
+    return snapshot, len(changed['id']), deleted
@@ -1,15 +1,18 @@
 import json
+from unittest import skipUnless
 from decimal import Decimal
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.db import connection
-from django.db.models import Count, Case, When, F
+from django.db.models import F
+from django.test import override_settings
 from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from store.models import Book, UserBookRelation
+from store.models import AuthorStats, Book, UserBookRelation
 from store.serializers import BookSerializer
 
 
@@ -28,9 +31,9 @@ class BooksAPITestCase(APITestCase):
         url = reverse('book-list')
         with CaptureQueriesContext(connection) as queries:
             response = self.client.get(url)
+            # The books and their readers, the ETag comes from the cached version.
             self.assertEquals(2, len(queries))
         books = Book.objects.all().annotate(
-            likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username'),
         ).order_by('id')
         serialized_data = BookSerializer(books, many=True).data
@@ -43,11 +46,21 @@ class BooksAPITestCase(APITestCase):
             {'first_name': '', 'last_name': '', 'email': ''}
         ])
 
+    def test_get_does_not_join_relations(self):
+        url = reverse('book-list')
+        # Everything but the readers, which do come from the relations.
+        fields = ','.join(field for field in BookSerializer.Meta.fields if field != 'readers')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data={'fields': fields})
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals(1, response.data[0]['likes_count'])
+        for query in queries:
+            self.assertNotIn('store_userbookrelation', query['sql'])
+
     def test_get_filter(self):
         url = reverse('book-list')
         response = self.client.get(url, data={'price': '39.99'})
         books = Book.objects.filter(id__in=[self.book_2.id]).annotate(
-            likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username'),
         ).order_by('id')
         serialized_data = BookSerializer(books, many=True).data
@@ -58,18 +71,46 @@ class BooksAPITestCase(APITestCase):
         url = reverse('book-list')
         response = self.client.get(url, data={'search': 'John'})
         books = Book.objects.filter(id__in=[self.book_2.id, self.book_3.id]).annotate(
-            likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username'),
         ).order_by('id')
         serialized_data = BookSerializer(books, many=True).data
         self.assertEquals(status.HTTP_200_OK, response.status_code)
         self.assertEquals(serialized_data, response.data, response.data)
 
+    def test_get_search_ranked(self):
+        book_4 = Book.objects.create(name='John John', price='5.99', author_name='John', owner=None)
+        url = reverse('book-list')
+        response = self.client.get(url, data={'search': 'john'})
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals([book_4.id, self.book_2.id, self.book_3.id], [book['id'] for book in response.data])
+
+    def test_get_search_terms(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'search': 'Joh sec'})
+        self.assertEquals([self.book_2.id], [book['id'] for book in response.data])
+
+    def test_get_search_substring(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'search': 'OHN'})
+        self.assertEquals([self.book_2.id, self.book_3.id], [book['id'] for book in response.data])
+        response = self.client.get(url, data={'search': 'as jo'})
+        self.assertEquals([self.book_3.id], [book['id'] for book in response.data])
+        response = self.client.get(url, data={'search': 'Li'})
+        self.assertEquals([self.book_1.id], [book['id'] for book in response.data])
+
+    def test_get_search_after_update(self):
+        self.book_1.name = 'Renamed'
+        self.book_1.save()
+        url = reverse('book-list')
+        response = self.client.get(url, data={'search': 'renamed'})
+        self.assertEquals([self.book_1.id], [book['id'] for book in response.data])
+        response = self.client.get(url, data={'search': 'first'})
+        self.assertEquals([], response.data)
+
     def test_get_ordering_author_name_increase(self):
         url = reverse('book-list')
         response = self.client.get(url, data={'ordering': 'author_name'})
         books = Book.objects.filter(id__in=[self.book_2.id, self.book_1.id, self.book_3.id]).annotate(
-            likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username'),
         ).order_by('author_name')
         serialized_data = BookSerializer(books, many=True).data
@@ -80,7 +121,6 @@ class BooksAPITestCase(APITestCase):
         url = reverse('book-list')
         response = self.client.get(url, data={'ordering': '-author_name'})
         books = Book.objects.filter(id__in=[self.book_3.id, self.book_1.id, self.book_2.id]).annotate(
-            likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username'),
         ).order_by('-author_name')
         serialized_data = BookSerializer(books, many=True).data
@@ -91,7 +131,6 @@ class BooksAPITestCase(APITestCase):
         url = reverse('book-list')
         response = self.client.get(url, data={'ordering': 'price'})
         books = Book.objects.filter(id__in=[self.book_1.id, self.book_3.id, self.book_2.id]).annotate(
-            likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username'),
         ).order_by('price')
         serialized_data = BookSerializer(books, many=True).data
@@ -102,13 +141,226 @@ class BooksAPITestCase(APITestCase):
         url = reverse('book-list')
         response = self.client.get(url, data={'ordering': '-price'})
         books = Book.objects.filter(id__in=[self.book_2.id, self.book_3.id, self.book_1.id]).annotate(
-            likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username'),
         ).order_by('-price')
         serialized_data = BookSerializer(books, many=True).data
         self.assertEquals(status.HTTP_200_OK, response.status_code)
         self.assertEquals(serialized_data, response.data, response.data)
 
+    def test_get_paginated(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'page_size': 2})
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals([self.book_1.id, self.book_2.id], [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['previous'])
+        response = self.client.get(response.data['next'])
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals([self.book_3.id], [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['next'])
+
+    def test_get_paginated_ordering_price_decrease(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'page_size': 2, 'ordering': '-price'})
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals([self.book_2.id, self.book_3.id], [book['id'] for book in response.data['results']])
+        response = self.client.get(response.data['next'])
+        self.assertEquals([self.book_1.id], [book['id'] for book in response.data['results']])
+
+    def test_get_paginated_ordering_with_equal_values(self):
+        book_4 = Book.objects.create(name='Fourth', price='10.99', author_name='Li', owner=None)
+        url = reverse('book-list')
+        response = self.client.get(url, data={'page_size': 1, 'ordering': 'price'})
+        ids = []
+        while True:
+            self.assertEquals(status.HTTP_200_OK, response.status_code)
+            ids += [book['id'] for book in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEquals([self.book_1.id, book_4.id, self.book_3.id, self.book_2.id], ids)
+
+    def test_get_paginated_past_many_equal_values(self):
+        # More ties than DRF's offset_cutoff: each page must still start after the last one.
+        Book.objects.bulk_create(Book(name=f'Tied {i}', price='10.99', author_name='Li', author_key='li')
+                                 for i in range(1100))
+        url = reverse('book-list')
+        response = self.client.get(url, data={'page_size': 100, 'ordering': '-price', 'fields': 'id'})
+        ids = []
+        while True:
+            self.assertEquals(status.HTTP_200_OK, response.status_code)
+            ids += [book['id'] for book in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        expected = list(Book.objects.order_by('-price', '-id').values_list('id', flat=True))
+        self.assertEquals(expected, ids)
+        # The last page holds the 3 rows past 1100, the previous link goes back to the 100 before them.
+        previous = self.client.get(response.data['previous'])
+        self.assertEquals(expected[-103:-3], [book['id'] for book in previous.data['results']])
+
+    def test_get_readers_limit(self):
+        user_2 = User.objects.create(username='test_username2', first_name='Second')
+        UserBookRelation.objects.create(user=user_2, book=self.book_1, like=True)
+        url = reverse('book-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data={'readers_limit': 1})
+            self.assertEquals(2, len(queries))
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals([{'first_name': '', 'last_name': '', 'email': ''}], response.data[0]['readers'])
+        response = self.client.get(url, data={'readers_limit': 1000})
+        self.assertEquals(2, len(response.data[0]['readers']))
+
+    def test_get_readers_limit_wrong(self):
+        url = reverse('book-list')
+        for readers_limit in ('-1', '²', ''):
+            response = self.client.get(url, data={'readers_limit': readers_limit})
+            self.assertEquals(status.HTTP_400_BAD_REQUEST, response.status_code, readers_limit)
+
+    def test_get_readers(self):
+        user_2 = User.objects.create(username='test_username2', first_name='Second')
+        UserBookRelation.objects.create(user=user_2, book=self.book_1, like=True)
+        url = reverse('book-readers', args=(self.book_1.id,))
+        response = self.client.get(url, data={'page_size': 1})
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals([{'first_name': '', 'last_name': '', 'email': ''}], response.data['results'])
+        response = self.client.get(response.data['next'])
+        self.assertEquals([{'first_name': 'Second', 'last_name': '', 'email': ''}], response.data['results'])
+        self.assertIsNone(response.data['next'])
+
+    def test_get_readers_not_found(self):
+        url = reverse('book-readers', args=(self.book_3.id + 100,))
+        response = self.client.get(url)
+        self.assertEquals(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    @override_settings(STORE_CACHE_TIMEOUT=0)
+    def test_get_fast_list_identical(self):
+        UserBookRelation.objects.create(user=self.user_admin, book=self.book_1, in_bookmarks=True)
+        url = reverse('book-list')
+        for params in ({}, {'page_size': 2}, {'search': 'John'}, {'ordering': '-price'}, {'readers_limit': 1}):
+            with self.settings(STORE_FAST_BOOK_LIST=False):
+                expected_response = self.client.get(url, data=params)
+            with self.settings(STORE_FAST_BOOK_LIST=True):
+                response = self.client.get(url, data=params)
+            self.assertEquals(status.HTTP_200_OK, response.status_code)
+            self.assertEquals(expected_response.content, response.content, params)
+
+    def test_get_fields(self):
+        url = reverse('book-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data={'fields': 'name,price'})
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals([{'name': 'First one', 'price': '10.99'}, {'name': 'Second book', 'price': '39.99'},
+                           {'name': 'Ho was John', 'price': '25.99'}], response.data)
+        # One single table scan of the requested columns.
+        self.assertEquals(1, len(queries))
+        self.assertNotIn('JOIN', queries[0]['sql'])
+        self.assertNotIn('author_name', queries[0]['sql'])
+
+    def test_get_fields_expand(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'fields': 'id,owner_name', 'expand': 'readers', 'readers_limit': 1})
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals({'id': self.book_1.id, 'owner_name': None,
+                           'readers': [{'first_name': '', 'last_name': '', 'email': ''}]}, response.data[0])
+        self.assertEquals({'id': self.book_2.id, 'owner_name': 'test_username', 'readers': []}, response.data[1])
+        response = self.client.get(url, data={'expand': 'readers'})
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals(list(BookSerializer.Meta.fields), list(response.data[0]))
+
+    def test_get_fields_wrong(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'fields': 'name,secret'})
+        self.assertEquals(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEquals({'fields': 'Unknown fields: secret.'}, response.data)
+        response = self.client.get(url, data={'fields': 'name', 'expand': 'owner'})
+        self.assertEquals(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    @override_settings(STORE_CACHE_TIMEOUT=0)
+    def test_get_fields_identical(self):
+        url = reverse('book-list')
+        for params in ({'fields': 'name,rating'}, {'fields': 'name', 'page_size': 2, 'ordering': '-price'},
+                       {'fields': 'price,likes_count', 'expand': 'readers', 'search': 'John'}):
+            with self.settings(STORE_FAST_BOOK_LIST=False):
+                expected_response = self.client.get(url, data=params)
+            with self.settings(STORE_FAST_BOOK_LIST=True):
+                response = self.client.get(url, data=params)
+            async_response = self.client.get(reverse('async-book-list'), data=params)
+            self.assertEquals(status.HTTP_200_OK, response.status_code)
+            self.assertEquals(expected_response.content, response.content, params)
+            self.assertEquals(expected_response.content,
+                              async_response.content.replace(b'/async/book/', b'/book/'), params)
+        cursor = self.client.get(url, data={'fields': 'name', 'page_size': 2, 'ordering': '-price'}).data['next']
+        self.assertEquals([{'name': 'First one'}], self.client.get(cursor).data['results'])
+
+    def test_get_one_book_fields(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data={'fields': 'name,rating'})
+        self.assertEquals({'name': 'First one', 'rating': '5.00'}, response.data)
+        self.assertEquals(2, len(queries))
+        response = self.client.get(reverse('async-book-detail', args=(self.book_1.id,)), data={'fields': 'rating'})
+        self.assertEquals({'rating': '5.00'}, response.json())
+
+    def test_export(self):
+        url = reverse('book-export')
+        response = self.client.get(url)
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals('application/x-ndjson', response['Content-Type'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEquals(3, len(lines))
+        self.assertEquals({'id': self.book_1.id, 'name': 'First one', 'price': '10.99', 'author_name': 'Li',
+                           'likes_count': 1, 'bookmarks_count': 0, 'ratings_count': 1, 'rating': '5.00',
+                           'owner_name': None, 'my_like': False, 'my_in_bookmarks': False, 'my_rate': None},
+                          json.loads(lines[0]))
+
+    def test_export_csv(self):
+        url = reverse('book-export')
+        with self.settings(STORE_FAST_BOOK_LIST=True):
+            response = self.client.get(url, data={'output': 'csv', 'fields': 'name,price', 'search': 'John',
+                                                  'ordering': '-price'})
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals('text/csv', response['Content-Type'])
+        self.assertEquals('name,price\r\nSecond book,39.99\r\nHo was John,25.99\r\n',
+                          b''.join(response.streaming_content).decode())
+
+    def test_export_wrong(self):
+        url = reverse('book-export')
+        self.assertEquals(status.HTTP_400_BAD_REQUEST, self.client.get(url, data={'output': 'xml'}).status_code)
+        self.assertEquals(status.HTTP_400_BAD_REQUEST, self.client.get(url, data={'fields': 'readers'}).status_code)
+
+    def test_get_user_relation(self):
+        UserBookRelation.objects.create(user=self.user_admin, book=self.book_2, in_bookmarks=True, rate=3)
+        url = reverse('book-list')
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        # The session and the user, then the books and their readers as for anonymous clients.
+        self.assertEquals(4, len(queries))
+        self.assertEquals([(True, False, 5), (False, False, None), (False, False, None)],
+                          [(book['my_like'], book['my_in_bookmarks'], book['my_rate']) for book in response.data])
+        self.client.force_login(self.user_admin)
+        response = self.client.get(url)
+        self.assertEquals([(False, False, None), (False, True, 3), (False, False, None)],
+                          [(book['my_like'], book['my_in_bookmarks'], book['my_rate']) for book in response.data])
+
+    @override_settings(STORE_CACHE_TIMEOUT=0)
+    def test_get_user_relation_identical(self):
+        UserBookRelation.objects.create(user=self.user_admin, book=self.book_2, in_bookmarks=True, rate=3)
+        self.client.force_login(self.user_admin)
+        url = reverse('book-list')
+        for params in ({}, {'fields': 'id,my_rate'}, {'page_size': 2, 'ordering': '-price'}):
+            with self.settings(STORE_FAST_BOOK_LIST=False):
+                expected_response = self.client.get(url, data=params)
+            with self.settings(STORE_FAST_BOOK_LIST=True):
+                response = self.client.get(url, data=params)
+            async_response = self.client.get(reverse('async-book-list'), data=params)
+            self.assertEquals(expected_response.content, response.content, params)
+            self.assertEquals(expected_response.content,
+                              async_response.content.replace(b'/async/book/', b'/book/'), params)
+        response = self.client.get(reverse('book-detail', args=(self.book_2.id,)), data={'fields': 'my_rate'})
+        self.assertEquals({'my_rate': 3}, response.data)
+
     def test_get_one_book(self):
         url = reverse('book-detail', args=(self.book_1.id,))
         response = self.client.get(url, content_type='application/json')
@@ -118,8 +370,13 @@ class BooksAPITestCase(APITestCase):
             'price': self.book_1.price,
             'author_name': self.book_1.author_name,
             'likes_count': 1,
+            'bookmarks_count': 0,
+            'ratings_count': 1,
             'rating': '5.00',
             'owner_name': None,
+            'my_like': False,
+            'my_in_bookmarks': False,
+            'my_rate': None,
             'readers': [
                 {'first_name': '', 'last_name': '', 'email': ''}
             ]
@@ -239,6 +496,226 @@ class BooksAPITestCase(APITestCase):
         self.assertEquals(status.HTTP_204_NO_CONTENT, response.status_code)
         self.assertEquals(2, Book.objects.all().count())
 
+    def test_update_query_count(self):
+        url = reverse('book-detail', args=(self.book_2.id,))
+        json_data = json.dumps({'name': self.book_2.name, 'price': '299.99', 'author_name': 'John'})
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(url, data=json_data, content_type='application/json')
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        # Session, user, the book with its owner_id, the UPDATE, the author stats refresh (with its advisory lock on
+        # PostgreSQL) and the readers of the response, no owner.
+        self.assertEquals(8 + (connection.vendor == 'postgresql'), len(queries), [query['sql'] for query in queries])
+        self.assertEquals(1, len([query for query in queries if 'FROM "auth_user" WHERE' in query['sql']]))
+
+    def test_delete_query_count(self):
+        url = reverse('book-detail', args=(self.book_2.id,))
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(url)
+        self.assertEquals(status.HTTP_204_NO_CONTENT, response.status_code)
+        # Session, user, the book's id, owner_id and author_key, the cascade and the author stats refresh (with its
+        # advisory lock on PostgreSQL).
+        self.assertEquals(9 + (connection.vendor == 'postgresql'), len(queries), [query['sql'] for query in queries])
+        self.assertNotIn('"store_book"."name"', queries[2]['sql'])
+
+    def test_update_not_owner_query_count(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        json_data = json.dumps({'name': self.book_1.name, 'price': '299.99', 'author_name': 'Li'})
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(url, data=json_data, content_type='application/json')
+        self.assertEquals(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.assertEquals(3, len(queries), [query['sql'] for query in queries])
+
+    @override_settings(STORE_OWNER_SCOPED_WRITES=True)
+    def test_scoped_writes(self):
+        json_data = json.dumps({'name': 'New name', 'price': '299.99', 'author_name': 'Li'})
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(reverse('book-detail', args=(self.book_1.id,)), data=json_data,
+                                       content_type='application/json')
+        self.assertEquals(status.HTTP_404_NOT_FOUND, response.status_code)
+        # The owner filter rejects the book in the same query that would have fetched it.
+        self.assertEquals(3, len(queries))
+        self.assertIn(f'"store_book"."owner_id" = {self.user.id}', queries[2]['sql'])
+        response = self.client.delete(reverse('book-detail', args=(self.book_1.id,)))
+        self.assertEquals(status.HTTP_404_NOT_FOUND, response.status_code)
+        response = self.client.put(reverse('book-detail', args=(self.book_2.id,)), data=json_data,
+                                   content_type='application/json')
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals(3, len(self.client.get(reverse('book-list')).data))
+        self.client.force_login(self.user_admin)
+        response = self.client.delete(reverse('book-detail', args=(self.book_1.id,)))
+        self.assertEquals(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.client.logout()
+        response = self.client.delete(reverse('book-detail', args=(self.book_3.id,)))
+        self.assertEquals(status.HTTP_404_NOT_FOUND, response.status_code)
+        self.assertEquals(['New name', 'Ho was John'], list(Book.objects.order_by('id').values_list('name', flat=True)))
+
+
+class BooksCacheAPITestCase(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='First one', price='10.99', author_name='Li', owner=self.user)
+        self.book_2 = Book.objects.create(name='Second book', price='39.99', author_name='John', owner=self.user)
+
+    def test_get_cached(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'ordering': 'price'})
+        with CaptureQueriesContext(connection) as queries:
+            cached_response = self.client.get(url, data={'ordering': 'price'})
+            self.assertEquals(0, len(queries))
+        self.assertEquals(status.HTTP_200_OK, cached_response.status_code)
+        self.assertEquals(response.data, cached_response.data)
+        response = self.client.get(url, data={'ordering': '-price'})
+        self.assertEquals([self.book_2.id, self.book_1.id], [book['id'] for book in response.data])
+
+    def test_get_one_book_cached(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            self.assertEquals(0, len(queries))
+        self.assertEquals('10.99', response.data['price'])
+
+    def test_update_invalidates(self):
+        list_url = reverse('book-list')
+        url = reverse('book-detail', args=(self.book_1.id,))
+        self.client.get(list_url)
+        self.client.get(url)
+        self.client.force_login(self.user)
+        data = {'name': self.book_1.name, 'price': '299.99', 'author_name': self.book_1.author_name}
+        self.client.put(url, data=json.dumps(data), content_type='application/json')
+        self.assertEquals('299.99', self.client.get(url).data['price'])
+        self.assertEquals('299.99', self.client.get(list_url).data[0]['price'])
+
+    def test_relation_invalidates(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        other_url = reverse('book-detail', args=(self.book_2.id,))
+        self.client.force_login(self.user)
+        self.client.get(url)
+        self.client.get(other_url)
+        relation_url = reverse('userbookrelation-detail', args=(self.book_1.id,))
+        self.client.patch(relation_url, data=json.dumps({'like': True}), content_type='application/json')
+        self.assertEquals(1, self.client.get(url).data['likes_count'])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(other_url)
+            self.assertFalse([query for query in queries if '"store_book"' in query['sql']])
+
+    def test_delete_invalidates(self):
+        list_url = reverse('book-list')
+        self.client.get(list_url)
+        self.client.force_login(self.user)
+        self.client.delete(reverse('book-detail', args=(self.book_1.id,)))
+        self.assertEquals([self.book_2.id], [book['id'] for book in self.client.get(list_url).data])
+
+    def test_user_invalidates(self):
+        reader = User.objects.create(username='reader', first_name='Old')
+        UserBookRelation.objects.create(user=reader, book=self.book_2, like=True)
+        list_url = reverse('book-list')
+        url = reverse('book-detail', args=(self.book_1.id,))
+        self.client.get(list_url)
+        self.client.get(url)
+        self.user.username = 'new_username'
+        self.user.save()
+        self.assertEquals('new_username', self.client.get(url).data['owner_name'])
+        reader.first_name = 'New'
+        reader.save(update_fields=['first_name'])
+        self.assertEquals('New', self.client.get(list_url).data[1]['readers'][0]['first_name'])
+        self.user.delete()
+        self.assertIsNone(self.client.get(url).data['owner_name'])
+
+
+@override_settings(STORE_CACHE_TIMEOUT=0)
+class BooksConditionalAPITestCase(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='First one', price='10.99', author_name='Li', owner=self.user)
+        self.book_2 = Book.objects.create(name='Second book', price='39.99', author_name='John', owner=self.user)
+
+    def test_get_not_modified(self):
+        url = reverse('book-list')
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEquals(etag, response['ETag'])
+        self.assertEquals(0, len(queries))
+        self.assertNotIn('Last-Modified', response)
+        self.assertEquals(status.HTTP_200_OK, self.client.get(url, {'ordering': 'price'},
+                                                              HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_get_modified(self):
+        url = reverse('book-list')
+        etag = self.client.get(url)['ETag']
+        UserBookRelation.objects.create(user=self.user, book=self.book_2)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals([{'first_name': '', 'last_name': '', 'email': ''}], response.data[1]['readers'])
+        etag = response['ETag']
+        self.book_1.delete()
+        self.assertEquals(status.HTTP_200_OK, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_get_modified_same_count(self):
+        url = reverse('book-list')
+        etag = self.client.get(url)['ETag']
+        Book.objects.filter(pk=self.book_1.pk).delete()
+        book_3 = Book.objects.create(name='Third book', price='5.00', author_name='Mary')
+        # Written by a server whose clock lags behind: COUNT(*) and MAX(updated_at) are back to what they were.
+        Book.objects.filter(pk=book_3.pk).update(updated_at=self.book_1.updated_at)
+        self.assertEquals(status.HTTP_200_OK, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_get_one_book_not_modified(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEquals(1, len(queries))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEquals(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        response = self.client.get(url, {'readers_limit': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+
+    def test_get_one_book_modified(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.user)
+        relation_url = reverse('userbookrelation-detail', args=(self.book_1.id,))
+        self.client.patch(relation_url, data=json.dumps({'rate': 4}), content_type='application/json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals('4.00', response.data['rating'])
+        self.assertEquals(status.HTTP_304_NOT_MODIFIED,
+                          self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code)
+
+    @override_settings(STORE_COUNTERS_MODE='deferred')
+    def test_get_deferred_user_relation(self):
+        url = reverse('book-detail', args=(self.book_1.id,))
+        self.assertIn('ETag', self.client.get(url))
+        self.client.force_login(self.user)
+        self.assertNotIn('ETag', self.client.get(url))
+
+    def test_get_one_book_not_found(self):
+        response = self.client.get(reverse('book-detail', args=(self.book_2.id + 1,)), HTTP_IF_NONE_MATCH='"x"')
+        self.assertEquals(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    @override_settings(STORE_CACHE_TIMEOUT=60)
+    def test_get_cached_not_modified(self):
+        cache.clear()
+        url = reverse('book-detail', args=(self.book_1.id,))
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEquals(0, len(queries))
+        self.assertEquals(etag, self.client.get(url)['ETag'])
+
 
 class UserBookRelationAPITestCase(APITestCase):
 
@@ -294,6 +771,445 @@ class UserBookRelationAPITestCase(APITestCase):
         response = self.client.patch(url, data=json_data, content_type='application/json')
         self.assertEquals(status.HTTP_400_BAD_REQUEST, response.status_code, response.data)
 
+    def test_update_counters(self):
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1, like=True, rate=4)
+        url = reverse('userbookrelation-detail', args=(self.book_1.id,))
+        self.client.force_login(self.user1)
+        for data in ({'like': True, 'rate': 2}, {'rate': 5}, {'like': False, 'in_bookmarks': True}, {}):
+            response = self.client.patch(url, data=json.dumps(data), content_type='application/json')
+            self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals({'book': self.book_1.id, 'like': False, 'in_bookmarks': True, 'rate': 5}, response.data)
+        self.book_1.refresh_from_db()
+        self.assertEquals((1, 1, 2, 9, '4.50'), (self.book_1.likes_count, self.book_1.bookmarks_count,
+                                                 self.book_1.ratings_count, self.book_1.rating_sum,
+                                                 str(self.book_1.rating)))
+
+    @skipUnless(connection.vendor == 'postgresql', 'The single statement upsert is PostgreSQL only.')
+    def test_update_query_count(self):
+        url = reverse('userbookrelation-detail', args=(self.book_1.id,))
+        self.client.force_login(self.user1)
+        self.client.get(reverse('book-list'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, data=json.dumps({'like': True}), content_type='application/json')
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']
+                      and 'django_session' not in query['sql'] and 'auth_user' not in query['sql']]
+        self.assertEquals(3, len(statements), statements)
+        self.assertTrue(statements[0].lstrip().startswith('WITH old AS'))
+        self.assertTrue(statements[1].startswith('UPDATE "store_book"'))
+        self.assertTrue(statements[2].startswith('UPDATE "store_authorstats"'))
+
+    def test_update_not_found(self):
+        url = reverse('userbookrelation-detail', args=(self.book_2.id + 100,))
+        self.client.force_login(self.user1)
+        response = self.client.patch(url, data=json.dumps({'like': True}), content_type='application/json')
+        self.assertEquals(status.HTTP_404_NOT_FOUND, response.status_code)
+        self.assertFalse(UserBookRelation.objects.exists())
+
+    def test_bulk(self):
+        UserBookRelation.objects.create(user=self.user1, book=self.book_1, in_bookmarks=True, rate=3)
+        UserBookRelation.objects.create(user=self.user2, book=self.book_1, rate=4)
+        url = reverse('userbookrelation-bulk')
+        data = [
+            {'book': self.book_1.id, 'like': True, 'rate': 5},
+            {'book': self.book_2.id, 'in_bookmarks': True},
+            {'book': self.book_2.id, 'rate': 2},
+            {'book': self.book_2.id + 100, 'like': True},
+            {'book': self.book_1.id, 'rate': 6},
+            {'book': 2 ** 63, 'like': True},
+            {'book': 0, 'like': True},
+        ]
+        json_data = json.dumps(data)
+        self.client.force_login(self.user1)
+        response = self.client.post(url, data=json_data, content_type='application/json')
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals(['ok', 'ok', 'ok', 'error', 'error', 'error', 'error'],
+                          [result['status'] for result in response.data])
+        self.assertIn('book', response.data[3]['errors'])
+        self.assertIn('rate', response.data[4]['errors'])
+        self.assertIn('book', response.data[5]['errors'])
+        self.assertIn('book', response.data[6]['errors'])
+        relation_1 = UserBookRelation.objects.get(user=self.user1, book=self.book_1)
+        relation_2 = UserBookRelation.objects.get(user=self.user1, book=self.book_2)
+        self.assertEquals((True, True, 5), (relation_1.like, relation_1.in_bookmarks, relation_1.rate))
+        self.assertEquals((False, True, 2), (relation_2.like, relation_2.in_bookmarks, relation_2.rate))
+        self.book_1.refresh_from_db()
+        self.book_2.refresh_from_db()
+        self.assertEquals((1, 1, 2, '4.50'), (self.book_1.likes_count, self.book_1.bookmarks_count,
+                                              self.book_1.ratings_count, str(self.book_1.rating)))
+        self.assertEquals((0, 1, 1, '2.00'), (self.book_2.likes_count, self.book_2.bookmarks_count,
+                                              self.book_2.ratings_count, str(self.book_2.rating)))
+
+    def test_bulk_query_count(self):
+        books = [Book.objects.create(name=f'Book {i}', price='1.99', author_name='Li') for i in range(20)]
+        url = reverse('userbookrelation-bulk')
+        json_data = json.dumps([{'book': book.id, 'like': True} for book in books])
+        self.client.force_login(self.user1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data=json_data, content_type='application/json')
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertLess(len(queries), 14)
+        self.assertEquals(20, UserBookRelation.objects.filter(user=self.user1, like=True).count())
+
+    def test_bulk_not_list(self):
+        url = reverse('userbookrelation-bulk')
+        self.client.force_login(self.user1)
+        response = self.client.post(url, data=json.dumps({'book': self.book_1.id}), content_type='application/json')
+        self.assertEquals(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_bulk_unauthenticated(self):
+        url = reverse('userbookrelation-bulk')
+        response = self.client.post(url, data=json.dumps([]), content_type='application/json')
+        self.assertEquals(status.HTTP_403_FORBIDDEN, response.status_code)
+
+
+class BooksBulkAPITestCase(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.user_admin = User.objects.create_superuser(username='admin_username')
+        self.book_1 = Book.objects.create(name='First one', price='10.99', author_name='Li', owner=None)
+        self.book_2 = Book.objects.create(name='Second book', price='39.99', author_name='John', owner=self.user)
+        self.book_3 = Book.objects.create(name='Third book', price='25.99', author_name='John', owner=self.user)
+        UserBookRelation.objects.create(user=self.user, book=self.book_2, like=True, rate=5)
+        self.url = reverse('book-bulk')
+
+    def test_create(self):
+        data = [
+            {'name': 'New book', 'price': '9.99', 'author_name': 'Mary'},
+            {'name': 'Another book', 'price': '19.99', 'author_name': ' mary '},
+        ]
+        self.client.force_login(self.user)
+        response = self.client.post(self.url, data=json.dumps(data), content_type='application/json')
+        self.assertEquals(status.HTTP_201_CREATED, response.status_code)
+        books = Book.objects.filter(owner=self.user, author_key='mary').order_by('id')
+        self.assertEquals([{'id': book.id, 'name': book.name, 'price': str(book.price), 'author_name': book.author_name}
+                           for book in books], response.data)
+        self.assertEquals((2, Decimal('29.98')), AuthorStats.objects.filter(author_key='mary')
+                          .values_list('books_count', 'price_sum').get())
+
+    def test_create_invalid(self):
+        data = [
+            {'name': 'New book', 'price': '9.99', 'author_name': 'Mary'},
+            {'name': 'Another book', 'price': '123456789.99', 'author_name': 'Mary'},
+            'New book',
+        ]
+        self.client.force_login(self.user)
+        response = self.client.post(self.url, data=json.dumps(data), content_type='application/json')
+        self.assertEquals(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEquals(3, len(response.data))
+        self.assertEquals({}, response.data[0])
+        self.assertIn('price', response.data[1])
+        self.assertIn('non_field_errors', response.data[2])
+        self.assertEquals(3, Book.objects.count())
+
+    def test_create_query_count(self):
+        data = [{'name': f'Book {i}', 'price': '1.99', 'author_name': f'Author {i % 3}'} for i in range(50)]
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data=json.dumps(data), content_type='application/json')
+        self.assertEquals(status.HTTP_201_CREATED, response.status_code)
+        self.assertLess(len(queries), 10, [query['sql'] for query in queries])
+        self.assertEquals(53, Book.objects.count())
+
+    def test_update(self):
+        data = [
+            {'id': self.book_2.id, 'name': 'Second one', 'price': '49.99', 'author_name': 'Mary'},
+            {'id': self.book_3.id, 'name': 'Third one', 'price': '5.99', 'author_name': 'John'},
+        ]
+        self.client.force_login(self.user)
+        response = self.client.put(self.url, data=json.dumps(data), content_type='application/json')
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals(data, response.data)
+        self.book_2.refresh_from_db()
+        self.assertEquals(('Second one', Decimal('49.99'), 'mary'),
+                          (self.book_2.name, self.book_2.price, self.book_2.author_key))
+        self.assertEquals({'john': (1, Decimal('5.99'), 0), 'mary': (1, Decimal('49.99'), 1)},
+                          {row[0]: row[1:] for row in AuthorStats.objects.filter(author_key__in=['john', 'mary'])
+                           .values_list('author_key', 'books_count', 'price_sum', 'likes_count')})
+
+    def test_partial_update(self):
+        data = [{'id': self.book_2.id, 'price': '1.99'}, {'id': self.book_3.id, 'name': 'Third one'}]
+        self.client.force_login(self.user)
+        response = self.client.patch(self.url, data=json.dumps(data), content_type='application/json')
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals([('Second book', Decimal('1.99')), ('Third one', Decimal('25.99'))],
+                          list(Book.objects.filter(id__in=[self.book_2.id, self.book_3.id]).order_by('id')
+                               .values_list('name', 'price')))
+
+    def test_update_errors(self):
+        data = [
+            {'id': self.book_2.id, 'name': 'Second one', 'price': '49.99', 'author_name': 'John'},
+            {'id': self.book_1.id, 'name': 'First', 'price': '1.99', 'author_name': 'Li'},
+            {'id': self.book_3.id + 100, 'name': 'Missing', 'price': '1.99', 'author_name': 'Li'},
+            {'id': self.book_2.id, 'name': 'Second again', 'price': '1.99', 'author_name': 'John'},
+            {'name': 'No id', 'price': '1.99', 'author_name': 'Li'},
+            {'id': self.book_3.id, 'name': 'Third one', 'price': '-', 'author_name': 'John'},
+        ]
+        self.client.force_login(self.user)
+        response = self.client.put(self.url, data=json.dumps(data), content_type='application/json')
+        self.assertEquals(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEquals({}, response.data[0])
+        self.assertEquals(['You do not have permission to change this book.'], response.data[1]['id'])
+        self.assertEquals(['Book does not exist.'], response.data[2]['id'])
+        self.assertEquals(['Duplicate id.'], response.data[3]['id'])
+        self.assertEquals(['This field is required.'], response.data[4]['id'])
+        self.assertEquals(['price'], list(response.data[5]))
+        self.assertEquals(['First one', 'Second book', 'Third book'],
+                          list(Book.objects.order_by('id').values_list('name', flat=True)))
+
+    def test_update_not_owner_but_staff(self):
+        data = [{'id': self.book_1.id, 'price': '1.99'}, {'id': self.book_2.id, 'price': '2.99'}]
+        self.client.force_login(self.user_admin)
+        response = self.client.patch(self.url, data=json.dumps(data), content_type='application/json')
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals([Decimal('1.99'), Decimal('2.99')],
+                          list(Book.objects.filter(id__in=[self.book_1.id, self.book_2.id]).order_by('id')
+                               .values_list('price', flat=True)))
+
+    @override_settings(STORE_OWNER_SCOPED_WRITES=True)
+    def test_update_scoped(self):
+        self.client.force_login(self.user)
+        response = self.client.patch(self.url, data=json.dumps([{'id': self.book_1.id, 'price': '1.99'}]),
+                                     content_type='application/json')
+        self.assertEquals(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEquals([{'id': ['Book does not exist.']}], response.data)
+
+    def test_update_invalidates(self):
+        self.client.force_login(self.user)
+        detail_url = reverse('book-detail', args=(self.book_2.id,))
+        self.assertEquals('39.99', self.client.get(detail_url).data['price'])
+        self.assertEquals('39.99', self.client.get(reverse('book-list')).data[1]['price'])
+        response = self.client.patch(self.url, data=json.dumps([{'id': self.book_2.id, 'price': '1.99'}]),
+                                     content_type='application/json')
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals('1.99', self.client.get(detail_url).data['price'])
+        self.assertEquals('1.99', self.client.get(reverse('book-list')).data[1]['price'])
+
+    def test_update_query_count(self):
+        books = [Book.objects.create(name=f'Book {i}', price='1.99', author_name=f'Author {i % 3}', owner=self.user)
+                 for i in range(50)]
+        data = [{'id': book.id, 'price': '2.99', 'author_name': f'Author {i % 5}'} for i, book in enumerate(books)]
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, data=json.dumps(data), content_type='application/json')
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertLess(len(queries), 12, [query['sql'] for query in queries])
+        self.assertEquals(50, Book.objects.filter(price='2.99').count())
+        self.assertEquals(10, AuthorStats.objects.get(author_key='author 4').books_count)
+
+    def test_delete(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(self.url, data=json.dumps([self.book_2.id, self.book_3.id]),
+                                          content_type='application/json')
+        self.assertEquals(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertEquals([self.book_1.id], list(Book.objects.values_list('id', flat=True)))
+        self.assertFalse(UserBookRelation.objects.exists())
+        self.assertFalse(AuthorStats.objects.filter(author_key='john').exists())
+        deletes = [query['sql'] for query in queries if query['sql'].startswith('DELETE')]
+        # The relations, the dirty books, the books and the emptied author stats.
+        self.assertEquals(4, len(deletes), deletes)
+
+    def test_delete_errors(self):
+        self.client.force_login(self.user)
+        response = self.client.delete(self.url, data=json.dumps([self.book_2.id, self.book_1.id, 'x', 2 ** 63]),
+                                      content_type='application/json')
+        self.assertEquals(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEquals({}, response.data[0])
+        self.assertIn('id', response.data[1])
+        self.assertIn('id', response.data[2])
+        self.assertIn('id', response.data[3])
+        self.assertEquals(3, Book.objects.count())
+
+    def test_delete_not_owner_but_staff(self):
+        self.client.force_login(self.user_admin)
+        response = self.client.delete(self.url, data=json.dumps([self.book_1.id]), content_type='application/json')
+        self.assertEquals(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertEquals(2, Book.objects.count())
+
+    def test_not_list(self):
+        self.client.force_login(self.user)
+        response = self.client.delete(self.url, data=json.dumps({'id': self.book_2.id}),
+                                      content_type='application/json')
+        self.assertEquals(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEquals(3, Book.objects.count())
+
+    def test_unauthenticated(self):
+        response = self.client.post(self.url, data=json.dumps([]), content_type='application/json')
+        self.assertEquals(status.HTTP_403_FORBIDDEN, response.status_code)
+
+
+@override_settings(STORE_CACHE_TIMEOUT=0)
+class BooksFeedAPITestCase(APITestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create(username=f'user_{i}') for i in range(3)]
+        self.books = [Book.objects.create(name=f'Book {i}', price='10.00', author_name='Li') for i in range(5)]
+        for user, book, rate in [(0, 0, 3), (1, 0, 4), (0, 1, 5), (0, 2, 3), (1, 2, 4), (2, 2, 5), (2, 3, None)]:
+            UserBookRelation.objects.create(user=self.users[user], book=self.books[book], like=rate != 3, rate=rate)
+
+    def get_feed(self, feed, **params):
+        response = self.client.get(reverse('book-feed', kwargs={'feed': feed}), data=params)
+        self.assertEquals(status.HTTP_200_OK, response.status_code, response.data)
+        return response
+
+    def test_top_rated(self):
+        response = self.get_feed('top_rated')
+        self.assertEquals([(self.books[1].id, '5.00'), (self.books[2].id, '4.00'), (self.books[0].id, '3.50')],
+                          [(book['id'], book['rating']) for book in response.data['results']])
+        self.assertIsNone(response.data['next'])
+
+    def test_most_liked(self):
+        response = self.get_feed('most_liked', page_size=2)
+        self.assertEquals([self.books[2].id, self.books[3].id], [book['id'] for book in response.data['results']])
+        response = self.client.get(response.data['next'])
+        self.assertEquals([self.books[1].id, self.books[0].id], [book['id'] for book in response.data['results']])
+        response = self.client.get(response.data['next'])
+        self.assertEquals([self.books[4].id], [book['id'] for book in response.data['results']])
+        self.assertIsNone(response.data['next'])
+
+    def test_most_bookmarked_fields(self):
+        response = self.get_feed('most_bookmarked', page_size=4, fields='name')
+        self.assertEquals([{'name': f'Book {i}'} for i in (4, 3, 2, 1)], response.data['results'])
+        response = self.client.get(response.data['next'])
+        self.assertEquals([{'name': 'Book 0'}], response.data['results'])
+
+    def test_query_count(self):
+        next_url = self.get_feed('most_liked', page_size=2).data['next']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(next_url)
+        # The books tied with the cursor, the books below it and their readers, no count.
+        self.assertEquals(3, len(queries))
+        self.assertEquals(2, len(response.data['results']))
+
+    def test_invalid(self):
+        response = self.client.get(reverse('book-feed', kwargs={'feed': 'most_liked'}), data={'cursor': 'abc'})
+        self.assertEquals(status.HTTP_404_NOT_FOUND, response.status_code)
+        response = self.client.get('/book/feed/cheapest/')
+        self.assertEquals(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    @override_settings(STORE_CACHE_TIMEOUT=60)
+    def test_like_invalidates(self):
+        cache.clear()
+        self.assertEquals(self.books[2].id, self.get_feed('most_liked').data['results'][0]['id'])
+        for user in self.users:
+            UserBookRelation.objects.create(user=user, book=self.books[4], like=True)
+        self.assertEquals(self.books[4].id, self.get_feed('most_liked').data['results'][0]['id'])
+
+
+class AuthorStatsAPITestCase(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.book_1 = Book.objects.create(name='First one', price='10.00', author_name='Li')
+        self.book_2 = Book.objects.create(name='Second book', price='21.00', author_name='li')
+        self.book_3 = Book.objects.create(name='Ho was John', price='25.99', author_name='John')
+        Book.objects.create(name='Unrated', price='1.00', author_name='Mary')
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user, book=self.book_2, like=True, rate=4)
+        UserBookRelation.objects.create(user=self.user, book=self.book_3, rate=2)
+
+    def test_get(self):
+        response = self.client.get(reverse('authorstats-list'))
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals(3, response.data['count'])
+        self.assertEquals([
+            {'author_name': 'John', 'books_count': 1, 'average_price': '25.99', 'average_rating': '2.00',
+             'likes_count': 0, 'ratings_count': 1},
+            {'author_name': 'Li', 'books_count': 2, 'average_price': '15.50', 'average_rating': '4.50',
+             'likes_count': 2, 'ratings_count': 2},
+            {'author_name': 'Mary', 'books_count': 1, 'average_price': '1.00', 'average_rating': None,
+             'likes_count': 0, 'ratings_count': 0},
+        ], response.data['results'])
+
+    def test_ordering(self):
+        response = self.client.get(reverse('authorstats-list'), data={'ordering': '-average_price'})
+        self.assertEquals(['John', 'Li', 'Mary'], [row['author_name'] for row in response.data['results']])
+        response = self.client.get(reverse('authorstats-list'), data={'ordering': '-likes_count', 'limit': 1})
+        self.assertEquals(['Li'], [row['author_name'] for row in response.data['results']])
+
+    def test_filter(self):
+        response = self.client.get(reverse('authorstats-list'), data={'books_count__gte': 2})
+        self.assertEquals(['Li'], [row['author_name'] for row in response.data['results']])
+        response = self.client.get(reverse('authorstats-list'), data={'search': 'mar'})
+        self.assertEquals(['Mary'], [row['author_name'] for row in response.data['results']])
+
+    def test_read_only(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('authorstats-list'), data={'author_name': 'Li'})
+        self.assertEquals(status.HTTP_405_METHOD_NOT_ALLOWED, response.status_code)
+        self.assertEquals(3, AuthorStats.objects.count())
+
+
+class AsyncBooksAPITestCase(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        self.user_admin = User.objects.create_superuser(username='admin_username')
+        self.book_1 = Book.objects.create(name='First one', price='10.99', author_name='Li', owner=None)
+        self.book_2 = Book.objects.create(name='Second book', price='39.99', author_name='John', owner=self.user)
+        self.book_3 = Book.objects.create(name='Ho was John', price='25.99', author_name='Mary', owner=None)
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user_admin, book=self.book_1, in_bookmarks=True)
+
+    @override_settings(STORE_CACHE_TIMEOUT=0)
+    def test_get_identical(self):
+        for params in ({}, {'page_size': 2}, {'search': 'John'}, {'ordering': '-price'}, {'readers_limit': 1}):
+            expected_response = self.client.get(reverse('book-list'), data=params)
+            response = self.client.get(reverse('async-book-list'), data=params)
+            self.assertEquals(status.HTTP_200_OK, response.status_code)
+            self.assertEquals(expected_response.content, response.content.replace(b'/async/book/', b'/book/'), params)
+
+    @override_settings(STORE_CACHE_TIMEOUT=0)
+    def test_get_one_book_identical(self):
+        expected_response = self.client.get(reverse('book-detail', args=(self.book_1.id,)))
+        response = self.client.get(reverse('async-book-detail', args=(self.book_1.id,)))
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals(expected_response.content, response.content)
+
+    def test_get_one_book_not_found(self):
+        response = self.client.get(reverse('async-book-detail', args=(self.book_3.id + 1,)))
+        self.assertEquals(status.HTTP_404_NOT_FOUND, response.status_code)
+        self.assertEquals({'detail': 'Not found.'}, response.json())
+
+    def test_get_readers_limit_wrong(self):
+        response = self.client.get(reverse('async-book-list'), data={'readers_limit': 'a'})
+        self.assertEquals(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_relation(self):
+        url = reverse('async-userbookrelation-detail', args=(self.book_1.id,))
+        self.client.force_login(self.user)
+        response = self.client.patch(url, data=json.dumps({'like': False, 'rate': 3}), content_type='application/json')
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertEquals({'book': self.book_1.id, 'like': False, 'in_bookmarks': False, 'rate': 3}, response.json())
+        self.book_1.refresh_from_db()
+        self.assertEquals((0, 1, 3), (self.book_1.likes_count, self.book_1.ratings_count, self.book_1.rating_sum))
+
+    def test_relation_create(self):
+        url = reverse('async-userbookrelation-detail', args=(self.book_2.id,))
+        self.client.force_login(self.user)
+        response = self.client.patch(url, data=json.dumps({'in_bookmarks': True}), content_type='application/json')
+        self.assertEquals(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(UserBookRelation.objects.get(user=self.user, book=self.book_2).in_bookmarks)
+
+    def test_relation_wrong(self):
+        url = reverse('async-userbookrelation-detail', args=(self.book_1.id,))
+        self.client.force_login(self.user)
+        response = self.client.patch(url, data=json.dumps({'rate': 6}), content_type='application/json')
+        self.assertEquals(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('rate', response.json())
+        response = self.client.patch(reverse('async-userbookrelation-detail', args=(self.book_3.id + 1,)),
+                                     data=json.dumps({'like': True}), content_type='application/json')
+        self.assertEquals(status.HTTP_404_NOT_FOUND, response.status_code)
+        response = self.client.get(url)
+        self.assertEquals(status.HTTP_405_METHOD_NOT_ALLOWED, response.status_code)
+
+    def test_relation_unauthenticated(self):
+        url = reverse('async-userbookrelation-detail', args=(self.book_1.id,))
+        response = self.client.patch(url, data=json.dumps({'like': True}), content_type='application/json')
+        self.assertEquals(status.HTTP_403_FORBIDDEN, response.status_code)
+
 
 class AuthAPITestCase(APITestCase):
 
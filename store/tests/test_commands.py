@@ -0,0 +1,267 @@
+import json
+import tempfile
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from store.logic import find_author_stats_drift, find_counter_drift
+from store.models import AuthorStats, Book, DirtyBook, UserBookRelation
+
+
+class RebuildRatingsCommandTestCase(TestCase):
+
+    def setUp(self):
+        user_1 = User.objects.create(username='test_user1')
+        user_2 = User.objects.create(username='test_user2')
+        self.book_1 = Book.objects.create(name='First one', price='10.99', author_name='Li')
+        self.book_2 = Book.objects.create(name='Second book', price='19.99', author_name='John')
+        UserBookRelation.objects.create(user=user_1, book=self.book_1, rate=5)
+        UserBookRelation.objects.create(user=user_2, book=self.book_1, rate=4)
+        UserBookRelation.objects.create(user=user_1, book=self.book_2, like=True)
+
+    def test_rebuild(self):
+        Book.objects.update(rating=None, rating_sum=100, ratings_count=100)
+        out = StringIO()
+        call_command('rebuild_ratings', stdout=out)
+        self.assertIn('Rebuilt ratings of 2 books', out.getvalue())
+        self.book_1.refresh_from_db()
+        self.book_2.refresh_from_db()
+        self.assertEquals((9, 2, '4.50'), (self.book_1.rating_sum, self.book_1.ratings_count, str(self.book_1.rating)))
+        self.assertEquals((0, 0, None), (self.book_2.rating_sum, self.book_2.ratings_count, self.book_2.rating))
+
+    def test_rebuild_selected_books(self):
+        Book.objects.update(rating_sum=100)
+        call_command('rebuild_ratings', str(self.book_2.id), stdout=StringIO())
+        self.book_1.refresh_from_db()
+        self.book_2.refresh_from_db()
+        self.assertEquals(100, self.book_1.rating_sum)
+        self.assertEquals(0, self.book_2.rating_sum)
+
+
+class ReconcileCountersCommandTestCase(TestCase):
+
+    def setUp(self):
+        user_1 = User.objects.create(username='test_user1')
+        user_2 = User.objects.create(username='test_user2')
+        self.book_1 = Book.objects.create(name='First one', price='10.99', author_name='Li')
+        self.book_2 = Book.objects.create(name='Second book', price='19.99', author_name='John')
+        UserBookRelation.objects.create(user=user_1, book=self.book_1, like=True, in_bookmarks=True, rate=5)
+        UserBookRelation.objects.create(user=user_2, book=self.book_1, like=True, rate=4)
+        UserBookRelation.objects.create(user=user_1, book=self.book_2, like=True)
+
+    def test_no_drift(self):
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertEquals('Found 0 books with drifted counters\n', out.getvalue())
+
+    def test_report_drift(self):
+        Book.objects.filter(id=self.book_1.id).update(likes_count=7)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn(f'Book {self.book_1.id}: likes_count 7 != 2', out.getvalue())
+        self.assertIn('Found 1 books with drifted counters', out.getvalue())
+        self.book_1.refresh_from_db()
+        self.assertEquals(7, self.book_1.likes_count)
+
+    def test_fix_drift(self):
+        Book.objects.update(likes_count=0, bookmarks_count=5, ratings_count=0, rating_sum=0, rating=None)
+        out = StringIO()
+        call_command('reconcile_counters', '--fix', stdout=out)
+        self.assertIn('Fixed counters of 2 books', out.getvalue())
+        self.book_1.refresh_from_db()
+        self.book_2.refresh_from_db()
+        self.assertEquals((2, 1, 2, 9, '4.50'), (self.book_1.likes_count, self.book_1.bookmarks_count,
+                                                 self.book_1.ratings_count, self.book_1.rating_sum,
+                                                 str(self.book_1.rating)))
+        self.assertEquals((1, 0, 0, 0, None), (self.book_2.likes_count, self.book_2.bookmarks_count,
+                                               self.book_2.ratings_count, self.book_2.rating_sum,
+                                               self.book_2.rating))
+
+
+class RebuildAuthorStatsCommandTestCase(TestCase):
+
+    def setUp(self):
+        Book.objects.create(name='First one', price='10.00', author_name='Li')
+        Book.objects.create(name='Second book', price='20.00', author_name='John')
+
+    def test_check(self):
+        AuthorStats.objects.filter(author_key='li').update(books_count=5)
+        out = StringIO()
+        call_command('rebuild_author_stats', '--check', stdout=out)
+        self.assertIn("Author 'li': books_count 5 != 1", out.getvalue())
+        self.assertIn('Found 1 authors with drifted stats', out.getvalue())
+        self.assertEquals(5, AuthorStats.objects.get(author_key='li').books_count)
+
+    def test_rebuild(self):
+        AuthorStats.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_author_stats', stdout=out)
+        self.assertIn('Found 2 authors with drifted stats', out.getvalue())
+        self.assertEquals({}, find_author_stats_drift())
+
+
+class BenchStoreCommandTestCase(TestCase):
+
+    def test_bench(self):
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('bench_store', sizes='5,15', users=4, relations_per_book=2, requests=2,
+                         output=output.name, stdout=StringIO())
+            results = json.load(output)
+        self.assertEquals([], results['regressions'])
+        self.assertEquals({'5', '15'}, set(results['sizes']))
+        self.assertEquals({'list', 'list_page', 'detail', 'filter', 'search', 'ordering', 'relation_update'},
+                          set(results['sizes']['15']))
+        self.assertEquals({'queries', 'p50_ms', 'p95_ms', 'p99_ms', 'peak_kb'}, set(results['sizes']['15']['list']))
+        self.assertEquals(0, Book.objects.count())
+
+    def test_bench_regression(self):
+        with self.assertRaises(CommandError):
+            call_command('bench_store', sizes='5,15', users=4, relations_per_book=2, requests=1,
+                         max_query_growth=-1, stdout=StringIO())
+
+
+class LoadtestAsyncCommandTestCase(TestCase):
+
+    def test_loadtest(self):
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('loadtest_async', books=10, users=4, relations_per_book=2, requests=4, concurrency=2,
+                         output=output.name, stdout=StringIO())
+            results = json.load(output)
+        self.assertEquals({'list_page', 'detail', 'relation_update'}, set(results))
+        self.assertEquals({'wsgi_rps', 'asgi_rps'}, set(results['detail']))
+        self.assertEquals(0, Book.objects.count())
+
+
+@override_settings(STORE_COUNTERS_MODE='deferred', STORE_COUNTERS_MAX_DELAY=0)
+class ProcessDirtyBooksCommandTestCase(TestCase):
+
+    def test_process(self):
+        user = User.objects.create(username='test_user1')
+        book = Book.objects.create(name='First one', price='10.99', author_name='Li')
+        UserBookRelation.objects.create(user=user, book=book, like=True, rate=4)
+        out, err = StringIO(), StringIO()
+        call_command('process_dirty_books', once=True, stdout=out, stderr=err)
+        self.assertEquals('Rebuilt counters of 1 books\n', out.getvalue())
+        self.assertIn('behind', err.getvalue())
+        self.assertFalse(DirtyBook.objects.exists())
+        book.refresh_from_db()
+        self.assertEquals((1, 1, 4), (book.likes_count, book.ratings_count, book.rating_sum))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Concurrent writers need PostgreSQL.')
+class StressRelationsCommandTestCase(TransactionTestCase):
+
+    def test_stress(self):
+        out = StringIO()
+        call_command('stress_relations', threads=4, updates=30, users=3, stdout=out)
+        self.assertIn('upsert', out.getvalue())
+        self.assertIn('locked', out.getvalue())
+        self.assertFalse(Book.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+
+class ExportBooksCommandTestCase(TestCase):
+
+    def setUp(self):
+        Book.objects.create(name='First one', price='10.99', author_name='Li')
+        Book.objects.create(name='Second book', price='19.99', author_name='John')
+        Book.objects.create(name='Third book', price='5.00', author_name='Li')
+
+    def test_export(self):
+        out = StringIO()
+        call_command('export_books', chunk_size=2, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEquals(['First one', 'Second book', 'Third book'], [json.loads(line)['name'] for line in lines])
+
+    def test_export_csv_file(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv', mode='r') as output:
+            call_command('export_books', output='csv', fields='name,price', ordering='price', search='book',
+                         file=output.name)
+            self.assertEquals('name,price\nThird book,5.00\nSecond book,19.99\n',
+                              output.read().replace('\r', ''))
+
+    def test_export_wrong(self):
+        with self.assertRaises(CommandError):
+            call_command('export_books', fields='readers', stdout=StringIO())
+
+
+class ImportBooksCommandTestCase(TestCase):
+
+    def import_file(self, suffix, content, **options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix) as input:
+            input.write(content)
+            input.flush()
+            out, err = StringIO(), StringIO()
+            call_command('import_books', input.name, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_books(self):
+        User.objects.create(username='owner')
+        out, err = self.import_file('.csv', 'name,price,author_name,owner\n'
+                                            'First one,10.99,Li,owner\n'
+                                            'Second book,abc,John,\n'
+                                            'Third book,5,Mary,nobody\n'
+                                            'Fourth book,7.50,Mary,\n', batch_size=2)
+        self.assertIn('Imported 2 books', out)
+        self.assertIn('2 bad rows', out)
+        self.assertIn('Line 3:', err)
+        self.assertIn('Line 4:', err)
+        self.assertEquals([('First one', '10.99', 'owner'), ('Fourth book', '7.50', None)],
+                          [(book.name, str(book.price), book.owner and book.owner.username)
+                           for book in Book.objects.order_by('id')])
+        self.assertEquals([('li', 1), ('mary', 1)], list(AuthorStats.objects.order_by('author_key').values_list(
+            'author_key', 'books_count')))
+
+    def test_import_relations(self):
+        user_1 = User.objects.create(username='user1')
+        User.objects.create(username='user2')
+        book_1 = Book.objects.create(name='First one', price='10.99', author_name='Li')
+        book_2 = Book.objects.create(name='Second book', price='19.99', author_name='John')
+        UserBookRelation.objects.create(user=user_1, book=book_1, like=True, rate=1)
+        lines = [
+            {'user': 'user1', 'book': book_1.id, 'rate': 5},
+            {'user': 'user2', 'book': book_1.id, 'like': True, 'rate': 4},
+            {'user': 'user2', 'book': book_2.id, 'in_bookmarks': True},
+            {'user': 'user2', 'book': book_2.id, 'in_bookmarks': True, 'rate': 3},
+            {'user': 'user3', 'book': book_2.id},
+            {'user': 'user1', 'book': book_2.id + 1},
+            {'user': 'user1', 'book': book_2.id, 'rate': 6},
+        ]
+        # Users, books, the existing relations and one INSERT per batch (the second batch has no valid rows), then one
+        # UPDATE of the counters and a refresh of the stats of their authors, locked on PostgreSQL.
+        with self.assertNumQueries(13 + (connection.vendor == 'postgresql')):
+            out, err = self.import_file('.ndjson', '\n'.join(map(json.dumps, lines)) + '\n{broken\n', kind='relations',
+                                        batch_size=4)
+        self.assertIn('Imported 4 relations', out)
+        self.assertIn('4 bad rows', out)
+        book_1.refresh_from_db()
+        book_2.refresh_from_db()
+        self.assertEquals((2, 0, 2, 9, '4.50'), (book_1.likes_count, book_1.bookmarks_count, book_1.ratings_count,
+                                                 book_1.rating_sum, str(book_1.rating)))
+        self.assertEquals((0, 1, 1, 3, '3.00'), (book_2.likes_count, book_2.bookmarks_count, book_2.ratings_count,
+                                                 book_2.rating_sum, str(book_2.rating)))
+        # The file has no like for user1, the existing one is kept.
+        relation = UserBookRelation.objects.get(user=user_1, book=book_1)
+        self.assertEquals((True, 5), (relation.like, relation.rate))
+        self.assertEquals(0, len(find_counter_drift()))
+        self.assertEquals({}, find_author_stats_drift())
+
+    @override_settings(STORE_CACHE_TIMEOUT=60)
+    def test_import_relations_invalidates(self):
+        cache.clear()
+        User.objects.create(username='user1')
+        book = Book.objects.create(name='First one', price='10.99', author_name='Li')
+        url = reverse('book-detail', args=(book.id,))
+        self.assertEquals(0, self.client.get(url).data['likes_count'])
+        self.import_file('.ndjson', json.dumps({'user': 'user1', 'book': book.id, 'like': True}), kind='relations')
+        self.assertEquals(1, self.client.get(url).data['likes_count'])
+
+    def test_import_missing_file(self):
+        with self.assertRaises(CommandError):
+            call_command('import_books', '/nonexistent.csv', stdout=StringIO())
@@ -1,9 +1,12 @@
 from unittest import TestCase
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase as DjangoTestCase, override_settings
 
-from store.logic import set_rating
-from store.models import UserBookRelation, Book
+from store.logic import bulk_update_relations, find_author_stats_drift, process_dirty_books, set_rating
+from store.models import AuthorStats, UserBookRelation, Book, DirtyBook
 
 
 class SetRatingTestCase(TestCase):
@@ -22,3 +25,138 @@ class SetRatingTestCase(TestCase):
     def test_rating_ok(self):
         self.book_1.refresh_from_db()
         self.assertEqual('4.67', str(self.book_1.rating))
+        # set_rating recomputes the counters from the relations.
+        Book.objects.filter(pk=self.book_1.pk).update(rating=None, rating_sum=0, ratings_count=0)
+        self.book_1.refresh_from_db()
+        set_rating(self.book_1)
+        self.book_1.refresh_from_db()
+        self.assertEqual(('4.67', 14, 3), (str(self.book_1.rating), self.book_1.rating_sum,
+                                           self.book_1.ratings_count))
+
+
+@override_settings(STORE_COUNTERS_MODE='deferred')
+class DeferredCountersTestCase(DjangoTestCase):
+    def setUp(self):
+        self.user_1 = User.objects.create(username='test_user1')
+        self.user_2 = User.objects.create(username='test_user2')
+        self.book_1 = Book.objects.create(name='First one', price=10.99, author_name='Li')
+        self.book_2 = Book.objects.create(name='Second book', price=19.99, author_name='John')
+
+    def test_deferred(self):
+        UserBookRelation.objects.create(user=self.user_1, book=self.book_1, like=True, rate=5)
+        relation = UserBookRelation.objects.create(user=self.user_2, book=self.book_1, rate=4)
+        relation.save()
+        self.assertEquals(2, DirtyBook.objects.count())
+        self.book_1.refresh_from_db()
+        self.assertEquals((0, 0, None), (self.book_1.likes_count, self.book_1.ratings_count, self.book_1.rating))
+
+        # Savepoint, claim, one set-based rebuild and author stats refresh (with its advisory lock on PostgreSQL),
+        # delete and release, whatever the number of queued changes.
+        with self.assertNumQueries(9 + (connection.vendor == 'postgresql')):
+            self.assertEquals(1, process_dirty_books())
+        self.assertEquals(0, DirtyBook.objects.count())
+        self.book_1.refresh_from_db()
+        self.assertEquals((1, 2, '4.50'), (self.book_1.likes_count, self.book_1.ratings_count, str(self.book_1.rating)))
+        self.assertEquals(0, process_dirty_books())
+
+    def test_mode_unset(self):
+        # Without the setting counters are updated in the request.
+        with override_settings():
+            del settings.STORE_COUNTERS_MODE
+            UserBookRelation.objects.create(user=self.user_1, book=self.book_1, like=True, rate=5)
+        self.assertFalse(DirtyBook.objects.exists())
+        self.book_1.refresh_from_db()
+        self.assertEquals((1, '5.00'), (self.book_1.likes_count, str(self.book_1.rating)))
+
+    def test_delete(self):
+        relation = UserBookRelation.objects.create(user=self.user_1, book=self.book_1, like=True)
+        process_dirty_books()
+        relation.delete()
+        process_dirty_books()
+        self.book_1.refresh_from_db()
+        self.assertEquals(0, self.book_1.likes_count)
+
+    def test_batches(self):
+        UserBookRelation.objects.create(user=self.user_1, book=self.book_1, like=True)
+        UserBookRelation.objects.create(user=self.user_1, book=self.book_2, in_bookmarks=True)
+        self.assertEquals(1, process_dirty_books(batch_size=1))
+        self.assertEquals(1, process_dirty_books(batch_size=1))
+        self.book_2.refresh_from_db()
+        self.assertEquals(1, self.book_2.bookmarks_count)
+
+    def test_bulk(self):
+        bulk_update_relations(self.user_1, [{'book': self.book_1.id, 'like': True},
+                                            {'book': self.book_2.id, 'rate': 3}])
+        self.assertEquals({self.book_1.id, self.book_2.id}, set(DirtyBook.objects.values_list('book_id', flat=True)))
+        process_dirty_books()
+        self.book_2.refresh_from_db()
+        self.assertEquals('3.00', str(self.book_2.rating))
+
+
+class AuthorStatsTestCase(DjangoTestCase):
+    def setUp(self):
+        self.user_1 = User.objects.create(username='test_user1')
+        self.user_2 = User.objects.create(username='test_user2')
+        self.book_1 = Book.objects.create(name='First one', price='10.00', author_name='Li')
+        self.book_2 = Book.objects.create(name='Second book', price='20.00', author_name=' li ')
+        self.book_3 = Book.objects.create(name='Third book', price='5.00', author_name='John')
+
+    def stats(self, author_key):
+        stats = AuthorStats.objects.get(author_key=author_key)
+        return (stats.books_count, str(stats.price_sum), stats.likes_count, stats.ratings_count, stats.rating_sum)
+
+    def test_books(self):
+        self.assertEquals((2, '30.00', 0, 0, 0), self.stats('li'))
+        self.assertEquals((1, '5.00', 0, 0, 0), self.stats('john'))
+        self.book_2.price = '25.00'
+        self.book_2.save()
+        self.assertEquals((2, '35.00', 0, 0, 0), self.stats('li'))
+        self.book_3.author_name = 'LI'
+        self.book_3.save()
+        self.assertEquals((3, '40.00', 0, 0, 0), self.stats('li'))
+        self.assertFalse(AuthorStats.objects.filter(author_key='john').exists())
+        self.book_1.delete()
+        self.assertEquals((2, '30.00', 0, 0, 0), self.stats('li'))
+        self.assertEquals({}, find_author_stats_drift())
+
+    def test_queryset_delete(self):
+        Book.objects.filter(pk=self.book_1.pk).delete()
+        self.assertEquals((1, '20.00', 0, 0, 0), self.stats('li'))
+        Book.objects.filter(author_key='li').delete()
+        self.assertFalse(AuthorStats.objects.filter(author_key='li').exists())
+        self.assertEquals({}, find_author_stats_drift())
+
+    def test_relations(self):
+        UserBookRelation.objects.create(user=self.user_1, book=self.book_1, like=True, rate=5)
+        relation = UserBookRelation.objects.create(user=self.user_2, book=self.book_2, like=True, rate=2)
+        self.assertEquals((2, '30.00', 2, 2, 7), self.stats('li'))
+        relation.like = False
+        relation.rate = 4
+        relation.save()
+        self.assertEquals((2, '30.00', 1, 2, 9), self.stats('li'))
+        relation.delete()
+        self.assertEquals((2, '30.00', 1, 1, 5), self.stats('li'))
+        self.book_1.refresh_from_db()
+        self.book_1.author_name = 'Mary'
+        self.book_1.save()
+        self.assertEquals((1, '10.00', 1, 1, 5), self.stats('mary'))
+        self.assertEquals((1, '20.00', 0, 0, 0), self.stats('li'))
+        self.assertEquals({}, find_author_stats_drift())
+
+    @override_settings(STORE_COUNTERS_MODE='deferred')
+    def test_deferred(self):
+        UserBookRelation.objects.create(user=self.user_1, book=self.book_1, like=True, rate=5)
+        bulk_update_relations(self.user_2, [{'book': self.book_3.id, 'rate': 3}])
+        self.assertEquals((2, '30.00', 0, 0, 0), self.stats('li'))
+        process_dirty_books()
+        self.assertEquals((2, '30.00', 1, 1, 5), self.stats('li'))
+        self.assertEquals((1, '5.00', 0, 1, 3), self.stats('john'))
+
+    def test_drift(self):
+        AuthorStats.objects.filter(author_key='li').update(likes_count=3)
+        AuthorStats.objects.filter(author_key='john').delete()
+        AuthorStats.objects.create(author_key='nobody', author_name='Nobody', books_count=1)
+        drift = find_author_stats_drift()
+        self.assertEquals({'likes_count': (3, 0)}, drift['li'])
+        self.assertEquals((None, 1), drift['john']['books_count'])
+        self.assertEquals((1, None), drift['nobody']['books_count'])
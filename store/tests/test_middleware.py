@@ -0,0 +1,64 @@
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from store.middleware import RequestMetricsMiddleware
+from store.models import Book
+
+
+class RequestMetricsMiddlewareTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test_username')
+        for i in range(5):
+            Book.objects.create(name=f'Book {i}', price='10.00', author_name='Li', owner=self.user)
+
+    @override_settings(STORE_CACHE_TIMEOUT=0)
+    def test_server_timing(self):
+        with self.assertLogs('store.metrics', 'INFO') as logs:
+            response = self.client.get(reverse('book-list'))
+        timings = [timing.split(';')[0] for timing in response['Server-Timing'].split(', ')]
+        self.assertEquals(['db', 'serialize', 'render', 'app', 'total'], timings)
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        self.assertNotIn('serialize;dur=0.0,', response['Server-Timing'])
+        self.assertEquals(1, len(logs.records))
+        self.assertIn('"view":"book-list"', logs.output[0])
+        self.assertIn('"queries":2', logs.output[0])
+        self.assertIn(f'"size":{len(response.content)}', logs.output[0])
+        self.assertIn('"serialize_ms":', logs.output[0])
+
+    @override_settings(STORE_CACHE_TIMEOUT=0, STORE_FAST_BOOK_LIST=True)
+    def test_server_timing_fast_list(self):
+        response = self.client.get(reverse('book-list'))
+        self.assertNotIn('serialize;dur=0.0,', response['Server-Timing'])
+
+    def test_n_plus_one(self):
+        def view(request):
+            return HttpResponse(','.join(book.owner.username for book in Book.objects.all()))
+
+        with self.assertLogs('store.metrics', 'WARNING') as logs:
+            RequestMetricsMiddleware(view)(RequestFactory().get('/'))
+        self.assertEquals(1, len(logs.records))
+        self.assertIn('"count":5', logs.output[0])
+        self.assertIn('auth_user', logs.output[0])
+
+    def test_no_n_plus_one(self):
+        def view(request):
+            return HttpResponse(','.join(book.owner.username for book in Book.objects.select_related('owner')))
+
+        with self.assertNoLogs('store.metrics', 'WARNING'):
+            response = RequestMetricsMiddleware(view)(RequestFactory().get('/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    def test_async(self):
+        async def view(request):
+            return HttpResponse(await sync_to_async(Book.objects.count)())
+
+        middleware = RequestMetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertLogs('store.metrics', 'INFO') as logs:
+            response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertIn('"status":200', logs.output[0])
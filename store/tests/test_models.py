@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User
+from django.db import IntegrityError, connection
 from django.test import TestCase
 
 from store.models import Book, UserBookRelation
@@ -78,3 +79,116 @@ class UserBookRelationModelTest(TestCase):
     def test_user_book_relation_get_str(self):
         expected_result = f'{self.user.username}: {self.book}, RATE: {self.relation.rate}'
         self.assertEquals(expected_result, str(self.relation))
+
+
+class UserBookRelationRatingTest(TestCase):
+
+    def setUp(self):
+        self.user_1 = User.objects.create(username='test_user1')
+        self.user_2 = User.objects.create(username='test_user2')
+        self.book = Book.objects.create(name='Test book', price='999.99', author_name='Li')
+
+    def test_rate_updates_counters(self):
+        UserBookRelation.objects.create(user=self.user_1, book=self.book, rate=5)
+        relation = UserBookRelation.objects.create(user=self.user_2, book=self.book, rate=4)
+        self.book.refresh_from_db()
+        self.assertEquals((9, 2, '4.50'), (self.book.rating_sum, self.book.ratings_count, str(self.book.rating)))
+        relation.rate = 1
+        relation.save()
+        self.book.refresh_from_db()
+        self.assertEquals((6, 2, '3.00'), (self.book.rating_sum, self.book.ratings_count, str(self.book.rating)))
+        relation.rate = None
+        relation.save()
+        self.book.refresh_from_db()
+        self.assertEquals((5, 1, '5.00'), (self.book.rating_sum, self.book.ratings_count, str(self.book.rating)))
+
+    def test_like_and_bookmarks_update_counters(self):
+        relation = UserBookRelation.objects.create(user=self.user_1, book=self.book, like=True)
+        UserBookRelation.objects.create(user=self.user_2, book=self.book, like=True, in_bookmarks=True)
+        self.book.refresh_from_db()
+        self.assertEquals((2, 1, 0), (self.book.likes_count, self.book.bookmarks_count, self.book.ratings_count))
+        relation.like = False
+        relation.in_bookmarks = True
+        relation.save()
+        self.book.refresh_from_db()
+        self.assertEquals((1, 2, 0), (self.book.likes_count, self.book.bookmarks_count, self.book.ratings_count))
+        relation.delete()
+        self.book.refresh_from_db()
+        self.assertEquals((1, 1, 0), (self.book.likes_count, self.book.bookmarks_count, self.book.ratings_count))
+
+    def test_save_without_changes_does_not_touch_book(self):
+        relation = UserBookRelation.objects.create(user=self.user_1, book=self.book, like=True, rate=5)
+        with self.assertNumQueries(1):
+            relation.save()
+
+    def test_delete_updates_counters(self):
+        relation = UserBookRelation.objects.create(user=self.user_1, book=self.book, rate=5)
+        relation.delete()
+        self.book.refresh_from_db()
+        self.assertEquals((0, 0, None), (self.book.rating_sum, self.book.ratings_count, self.book.rating))
+
+
+    def test_cascade_and_queryset_deletes_update_counters(self):
+        UserBookRelation.objects.create(user=self.user_1, book=self.book, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user_2, book=self.book, like=True, in_bookmarks=True, rate=3)
+        self.user_1.delete()
+        self.book.refresh_from_db()
+        self.assertEquals((1, 1, 1, '3.00'), (self.book.likes_count, self.book.bookmarks_count,
+                                              self.book.ratings_count, str(self.book.rating)))
+        UserBookRelation.objects.filter(user=self.user_2).delete()
+        self.book.refresh_from_db()
+        self.assertEquals((0, 0, 0, None), (self.book.likes_count, self.book.bookmarks_count,
+                                            self.book.ratings_count, self.book.rating))
+
+    def test_deferred_load(self):
+        UserBookRelation.objects.create(user=self.user_1, book=self.book, like=True, rate=5)
+        relation = UserBookRelation.objects.only('id').get()
+        self.assertEquals(1, len(UserBookRelation.objects.defer('like', 'rate')))
+        relation.like = False
+        relation.save()
+        self.book.refresh_from_db()
+        self.assertEquals((0, 1), (self.book.likes_count, self.book.ratings_count))
+        UserBookRelation.objects.defer('rate').get().delete()
+        self.book.refresh_from_db()
+        self.assertEquals((0, 0, None), (self.book.likes_count, self.book.ratings_count, self.book.rating))
+
+
+class QueryIndexesTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test_user')
+        self.book = Book.objects.create(name='Test book', price='999.99', author_name='Li')
+        UserBookRelation.objects.create(user=self.user, book=self.book, like=True, rate=3)
+        if connection.vendor == 'postgresql':
+            # A handful of rows never beats a sequential scan, so ask the planner for its index choice.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, index_name, queryset):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            self.skipTest('Query plans are only checked on PostgreSQL and SQLite.')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_book_price_index(self):
+        self.assertUsesIndex('store_book_price_id_idx', Book.objects.filter(price='999.99'))
+        self.assertUsesIndex('store_book_price_id_idx', Book.objects.order_by('price', 'id'))
+        self.assertUsesIndex('store_book_price_id_idx', Book.objects.order_by('-price', '-id'))
+
+    def test_book_author_name_index(self):
+        self.assertUsesIndex('store_book_author_name_id_idx', Book.objects.order_by('author_name', 'id'))
+
+    def test_book_name_index(self):
+        self.assertUsesIndex('store_book_name_idx', Book.objects.filter(name='Test book'))
+
+    def test_relation_liked_index(self):
+        self.assertUsesIndex('store_ubr_book_liked_idx',
+                             UserBookRelation.objects.filter(book=self.book, like=True).values('id'))
+
+    def test_relation_rated_index(self):
+        self.assertUsesIndex('store_ubr_book_rated_idx',
+                             UserBookRelation.objects.filter(book=self.book, rate__isnull=False).values('rate'))
+
+    def test_relation_user_book_unique(self):
+        with self.assertRaises(IntegrityError):
+            UserBookRelation.objects.create(user=self.user, book=self.book)
@@ -0,0 +1,119 @@
+from unittest import skipUnless
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from store.models import Book
+from store.routers import PrimaryReplicaRouter, ReplicaPinningMiddleware, _primary_pinned, primary_pinned
+
+
+def unpin_primary(test):
+    # Writes made outside a request, like test fixtures, pin the primary for the rest of the thread.
+    test.addCleanup(_primary_pinned.reset, _primary_pinned.set(False))
+
+
+@override_settings(STORE_DATABASE_REPLICAS=['replica'])
+class PrimaryReplicaRouterTestCase(SimpleTestCase):
+
+    def setUp(self):
+        unpin_primary(self)
+        self.router = PrimaryReplicaRouter()
+
+    def route(self, method='get', cookies=None, write=False):
+        factory = RequestFactory()
+        for name, value in (cookies or {}).items():
+            factory.cookies[name] = value
+        request = getattr(factory, method)('/')
+        routes = []
+
+        def get_response(request):
+            routes.append(self.router.db_for_read(Book))
+            if write:
+                routes.append(self.router.db_for_write(Book))
+                routes.append(self.router.db_for_read(Book))
+            return HttpResponse()
+
+        response = ReplicaPinningMiddleware(get_response)(request)
+        return routes, response
+
+    def test_read(self):
+        routes, response = self.route()
+        self.assertEquals(['replica'], routes)
+        self.assertNotIn('store_primary', response.cookies)
+        self.assertFalse(primary_pinned())
+
+    def test_read_your_writes(self):
+        routes, response = self.route(write=True)
+        self.assertEquals(['replica', 'default', 'default'], routes)
+        self.assertEquals(5, response.cookies['store_primary']['max-age'])
+        self.assertFalse(primary_pinned())
+
+    def test_unsafe_method(self):
+        routes, response = self.route(method='post')
+        self.assertEquals(['default'], routes)
+        self.assertIn('store_primary', response.cookies)
+
+    def test_sticky_cookie(self):
+        routes, response = self.route(cookies={'store_primary': '1'})
+        self.assertEquals(['default'], routes)
+        self.assertNotIn('store_primary', response.cookies)
+
+    def test_sticky_cookie_refreshed_by_write(self):
+        routes, response = self.route(cookies={'store_primary': '1'}, write=True)
+        self.assertEquals(['default', 'default', 'default'], routes)
+        self.assertEquals(5, response.cookies['store_primary']['max-age'])
+        routes, response = self.route(method='post', cookies={'store_primary': '1'})
+        self.assertEquals(5, response.cookies['store_primary']['max-age'])
+
+    def test_other_apps(self):
+        self.assertIsNone(self.router.db_for_read(User))
+        self.assertIsNone(self.router.db_for_write(User))
+
+    def test_async(self):
+        async def get_response(request):
+            routes = [self.router.db_for_read(Book), await sync_to_async(self.router.db_for_write)(Book),
+                      self.router.db_for_read(Book)]
+            return HttpResponse(','.join(routes))
+
+        middleware = ReplicaPinningMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertEquals(b'replica,default,default', response.content)
+        self.assertEquals(5, response.cookies['store_primary']['max-age'])
+        self.assertFalse(primary_pinned())
+
+    @override_settings(STORE_DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        routes, response = self.route(write=True)
+        self.assertEquals(['default', 'default', 'default'], routes)
+        self.assertNotIn('store_primary', response.cookies)
+
+
+@skipUnless('test_replica' in settings.DATABASES, 'Run with --settings=books.test_settings.')
+@override_settings(STORE_DATABASE_REPLICAS=['test_replica'], STORE_CACHE_TIMEOUT=0)
+class ReplicaAPITestCase(TransactionTestCase):
+    # The two test databases are not replicated, so where a book lives shows which one was read.
+    databases = {'default', 'test_replica'}
+
+    def setUp(self):
+        Book.objects.using('test_replica').create(name='Replica book', price='10.00', author_name='Li')
+        unpin_primary(self)
+
+    def test_get(self):
+        response = self.client.get(reverse('book-list'))
+        self.assertEquals(['Replica book'], [book['name'] for book in response.data])
+
+    def test_get_after_write(self):
+        self.client.cookies['store_primary'] = '1'
+        response = self.client.get(reverse('book-list'))
+        self.assertEquals([], response.data)
+
+    def test_transaction(self):
+        with transaction.atomic():
+            self.assertFalse(Book.objects.exists())
+        self.assertTrue(Book.objects.exists())
@@ -1,9 +1,13 @@
 from django.contrib.auth.models import User
-from django.db.models import Count, Case, When, F
+from django.db.models import F, FilteredRelation, Prefetch, Q
+from django.db.models.functions import Coalesce
 from django.test import TestCase
 
+from rest_framework.renderers import JSONRenderer
+
 from store.models import Book, UserBookRelation
-from store.serializers import BookSerializer, UserBookRelationSerializer
+from store.renderers import ORJSONRenderer
+from store.serializers import BookSerializer, UserBookRelationSerializer, BOOK_VALUES_FIELDS, book_values_data
 
 
 class BooksSerializerTestCase(TestCase):
@@ -17,8 +21,14 @@ class BooksSerializerTestCase(TestCase):
                 'name': 'First one',
                 'author_name': 'Li',
                 'price': '10.99',
+                'likes_count': 0,
+                'bookmarks_count': 0,
+                'ratings_count': 0,
                 'rating': None,
                 'owner_name': '',
+                'my_like': False,
+                'my_in_bookmarks': False,
+                'my_rate': None,
                 'readers': []
             },
             {
@@ -26,8 +36,14 @@ class BooksSerializerTestCase(TestCase):
                 'name': 'Second book',
                 'author_name': 'John',
                 'price': '19.99',
+                'likes_count': 0,
+                'bookmarks_count': 0,
+                'ratings_count': 0,
                 'rating': None,
                 'owner_name': '',
+                'my_like': False,
+                'my_in_bookmarks': False,
+                'my_rate': None,
                 'readers': []
             },
         ]
@@ -48,10 +64,12 @@ class BooksSerializerTestCase(TestCase):
         UserBookRelation.objects.create(user=user_2, book=book_2, like=True, rate=4)
         UserBookRelation.objects.create(user=user_3, book=book_2, like=False)
 
-        books = Book.objects.all().annotate(likes_count=Count(Case(When(userbookrelation__like=True,
-                                                                        then=1))),
-                                            owner_name=F('owner__username'),
-                                            ).order_by('id')
+        books = Book.objects.all().annotate(owner_name=F('owner__username'),
+                                            my_relation=FilteredRelation('userbookrelation',
+                                                                         condition=Q(userbookrelation__user=user_1)),
+                                            ).annotate(my_like=F('my_relation__like'),
+                                                       my_in_bookmarks=F('my_relation__in_bookmarks'),
+                                                       my_rate=F('my_relation__rate')).order_by('id')
         serialized_data = BookSerializer(books, many=True).data
         expected_data = [
             {
@@ -60,8 +78,13 @@ class BooksSerializerTestCase(TestCase):
                 'author_name': 'Li',
                 'price': '10.99',
                 'likes_count': 3,
+                'bookmarks_count': 0,
+                'ratings_count': 3,
                 'rating': '4.67',
                 'owner_name': 'test_user1',
+                'my_like': True,
+                'my_in_bookmarks': False,
+                'my_rate': 5,
                 'readers': [
                     {'first_name': 'User1', 'last_name': 'User1', 'email': 'e1@ma.il'},
                     {'first_name': 'User2', 'last_name': 'User2', 'email': 'e2@ma.il'},
@@ -74,8 +97,13 @@ class BooksSerializerTestCase(TestCase):
                 'author_name': 'John',
                 'price': '19.99',
                 'likes_count': 2,
+                'bookmarks_count': 0,
+                'ratings_count': 2,
                 'rating': '3.50',
                 'owner_name': None,
+                'my_like': True,
+                'my_in_bookmarks': False,
+                'my_rate': 3,
                 'readers': [
                     {'first_name': 'User1', 'last_name': 'User1', 'email': 'e1@ma.il'},
                     {'first_name': 'User2', 'last_name': 'User2', 'email': 'e2@ma.il'},
@@ -86,6 +114,51 @@ class BooksSerializerTestCase(TestCase):
         self.assertEquals(expected_data, serialized_data, serialized_data)
 
 
+class BookValuesDataTestCase(TestCase):
+    def setUp(self):
+        user_1 = User.objects.create(username='test_user1', first_name='User1', last_name='User1', email='e1@ma.il')
+        user_2 = User.objects.create(username='test_user2', first_name='Юзер', last_name='User2', email='e2@ma.il')
+        user_3 = User.objects.create(username='test_user3', first_name='User3', last_name='User3', email='e3@ma.il')
+        book_1 = Book.objects.create(name='First one', price=10.99, author_name='Li', owner=user_1)
+        Book.objects.create(name='Second book\u2028', price=19.9, author_name='John')
+        Book.objects.create(name='Third', price=5, author_name='Mary')
+
+        UserBookRelation.objects.create(user=user_3, book=book_1, like=True, rate=5)
+        UserBookRelation.objects.create(user=user_1, book=book_1, like=True, in_bookmarks=True, rate=5)
+        UserBookRelation.objects.create(user=user_2, book=book_1, like=True, rate=4)
+        self.books = Book.objects.all().annotate(
+            owner_name=F('owner__username'),
+            my_relation=FilteredRelation('userbookrelation', condition=Q(userbookrelation__user=user_1)),
+        ).annotate(
+            my_like=Coalesce(F('my_relation__like'), False),
+            my_in_bookmarks=Coalesce(F('my_relation__in_bookmarks'), False),
+            my_rate=F('my_relation__rate'),
+        ).prefetch_related(Prefetch('readers', queryset=User.objects.order_by('id'))).order_by('id')
+
+    def test_book_values_data_ok(self):
+        expected_data = BookSerializer(self.books, many=True).data
+        with self.assertNumQueries(2):
+            data = book_values_data(list(self.books.values(*BOOK_VALUES_FIELDS)))
+        self.assertEquals(expected_data, data)
+        self.assertEquals(['User1', 'Юзер', 'User3'], [reader['first_name'] for reader in data[0]['readers']])
+        self.assertEquals((True, True, 5), (data[0]['my_like'], data[0]['my_in_bookmarks'], data[0]['my_rate']))
+        self.assertEquals((False, False, None), (data[1]['my_like'], data[1]['my_in_bookmarks'], data[1]['my_rate']))
+
+    def test_book_values_data_readers_limit(self):
+        data = book_values_data(list(self.books.values(*BOOK_VALUES_FIELDS)), readers_limit=2)
+        self.assertEquals(['User1', 'Юзер'], [reader['first_name'] for reader in data[0]['readers']])
+        self.assertEquals([], data[1]['readers'])
+
+    def test_renderer_output_is_identical(self):
+        data = book_values_data(list(self.books.values(*BOOK_VALUES_FIELDS)))
+        expected_content = JSONRenderer().render(BookSerializer(self.books, many=True).data)
+        self.assertEquals(expected_content, ORJSONRenderer().render(data))
+        self.assertEquals(JSONRenderer().render({'detail': 'Not found.', 1: [1.5, None]}),
+                          ORJSONRenderer().render({'detail': 'Not found.', 1: [1.5, None]}))
+        self.assertEquals(JSONRenderer().render(data, 'application/json; indent=4'),
+                          ORJSONRenderer().render(data, 'application/json; indent=4'))
+
+
 class UserBookRelationSerializerTestCase(TestCase):
     def test_user_book_relation_serializer_ok(self):
         user_1 = User.objects.create(username="test_user")
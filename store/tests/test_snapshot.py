@@ -0,0 +1,95 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import skipIf
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from store.models import Book, UserBookRelation
+from store.snapshot import BookSnapshot, build_snapshot, np, update_snapshot
+
+
+@skipIf(np is None, 'Book snapshots require numpy.')
+class BookSnapshotTestCase(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'books.snapshot')
+        self.user_1 = User.objects.create(username='test_user1')
+        self.user_2 = User.objects.create(username='test_user2')
+        self.book_1 = Book.objects.create(name='First one', price='10.99', author_name='Li')
+        self.book_2 = Book.objects.create(name='Second book', price='20.00', author_name='John')
+        self.book_3 = Book.objects.create(name='Third book', price='5.01', author_name='li')
+        UserBookRelation.objects.create(user=self.user_1, book=self.book_1, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user_2, book=self.book_1, like=True, rate=4)
+        UserBookRelation.objects.create(user=self.user_1, book=self.book_2, rate=2)
+
+    def test_build(self):
+        build_snapshot(self.path)
+        snapshot = BookSnapshot.load(self.path)
+        self.assertIsInstance(snapshot.price_cents, np.memmap)
+        self.assertEquals([self.book_1.id, self.book_2.id, self.book_3.id], snapshot.id.tolist())
+        self.assertEquals([1099, 2000, 501], snapshot.price_cents.tolist())
+        self.assertEquals([2, 0, 0], snapshot.likes_count.tolist())
+        self.assertEquals([4.5, 2.0], snapshot.rating[:2].tolist())
+        self.assertTrue(np.isnan(snapshot.rating[2]))
+        self.assertEquals(['li', 'john', 'li'], [snapshot.authors[code] for code in snapshot.author])
+
+    def test_aggregates(self):
+        snapshot = build_snapshot(self.path)
+        self.assertEquals({'li': 8.0, 'john': 20.0}, snapshot.author_means('price'))
+        self.assertEquals({'li': 4.5, 'john': 2.0}, snapshot.author_means('rating'))
+        counts, edges = snapshot.histogram('price', bins=2, range=(0, 20))
+        self.assertEquals([1, 2], counts.tolist())
+        self.assertEquals([1, 1], snapshot.histogram('rating', bins=2, range=(0, 5))[0].tolist())
+        self.assertEquals(10.99, snapshot.percentiles('price', 50))
+        self.assertEquals([2.0, 4.5], snapshot.percentiles('rating', [0, 100]).tolist())
+        self.assertEquals({'li': 2.0, 'john': 0.0}, snapshot.author_means('likes_count', where=snapshot.price > 10))
+
+    def test_update(self):
+        build_snapshot(self.path)
+        self.book_2.delete()
+        UserBookRelation.objects.create(user=self.user_2, book=self.book_3, like=True, rate=3)
+        book_4 = Book.objects.create(name='Fourth', price='7.50', author_name='Mary')
+        snapshot, changed, deleted = update_snapshot(self.path)
+        self.assertEquals(1, deleted)
+        self.assertGreaterEqual(changed, 2)
+        snapshot = BookSnapshot.load(self.path)
+        self.assertEquals([self.book_1.id, self.book_3.id, book_4.id], snapshot.id.tolist())
+        self.assertEquals([2, 1, 0], snapshot.likes_count.tolist())
+        self.assertEquals(['li', 'john', 'mary'], snapshot.authors)
+        self.assertEquals({'li': 3.75}, snapshot.author_means('rating'))
+        self.assertEquals(snapshot.price_cents.tolist(), build_snapshot(self.path).price_cents.tolist())
+
+    def test_update_late_commit(self):
+        build_snapshot(self.path)
+        # A book inserted by a transaction that committed long after it was stamped.
+        book_4 = Book.objects.create(name='Fourth', price='7.50', author_name='Mary')
+        Book.objects.filter(id=book_4.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        snapshot, changed, deleted = update_snapshot(self.path)
+        self.assertEquals([self.book_1.id, self.book_2.id, self.book_3.id, book_4.id], snapshot.id.tolist())
+        self.assertEquals(750, snapshot.price_cents[-1])
+
+    def test_empty(self):
+        Book.objects.all().delete()
+        build_snapshot(self.path)
+        snapshot = BookSnapshot.load(self.path)
+        self.assertEquals(0, len(snapshot))
+        self.assertEquals({}, snapshot.author_means('price'))
+        self.assertTrue(np.isnan(snapshot.percentiles('price', 50)))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('snapshot_books', path=self.path, stdout=out)
+        self.assertIn('Wrote 3 books', out.getvalue())
+        self.assertIn('full rebuild', out.getvalue())
+        Book.objects.create(name='Fourth', price='7.50', author_name='Mary')
+        out = StringIO()
+        call_command('snapshot_books', path=self.path, stdout=out)
+        self.assertIn('Wrote 4 books', out.getvalue())
+        self.assertIn('0 deleted', out.getvalue())
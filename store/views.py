@@ -1,42 +1,314 @@
-from django.db.models import Count, Case, When, Avg, F
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, FilteredRelation, FloatField, IntegerField, Prefetch, Q, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.fields import empty
+from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.generics import get_object_or_404
 from rest_framework.mixins import UpdateModelMixin
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.viewsets import ModelViewSet, GenericViewSet
+from rest_framework.response import Response
+from rest_framework.viewsets import ModelViewSet, GenericViewSet, ReadOnlyModelViewSet
 
-from store.models import Book, UserBookRelation
+from store.cache import cached_response, book_list_cache_key, book_cache_key, book_list_validators, \
+    book_validators, get_cache
+from store.export import EXPORT_FORMATS, export_lines
+from store.logic import BOOK_BULK_UPDATE_FIELDS, bulk_create_books, bulk_delete_books, bulk_update_books, \
+    bulk_update_relations, upsert_relation
+from store.middleware import serialization_timer
+from store.models import AuthorStats, Book, UserBookRelation
+from store.pagination import AuthorStatsPagination, BookCursorPagination, FeedPagination, ReaderCursorPagination
 from store.permissions import IsOwnerOrStaffOrReadOnly
-from store.serializers import BookSerializer, UserBookRelationSerializer
+from store.search import BookSearchFilter
+from store.serializers import AuthorStatsSerializer, BookSerializer, UserBookRelationSerializer, BookReaderSerializer, \
+    UserBookRelationBulkSerializer, BOOK_BULK_FIELDS, BOOK_USER_RELATION_FIELDS, BOOK_VALUES_FIELDS, book_bulk_ids, \
+    book_values_data
 
 
 class BookViewSet(ModelViewSet):
-    queryset = Book.objects.all().annotate(likes_count=Count(Case(When(userbookrelation__like=True,
-                                                                       then=1))),
-                                           owner_name=F('owner__username'),
-                                           ).prefetch_related('readers').order_by('id')
+    queryset = Book.objects.all().order_by('id')
     serializer_class = BookSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, BookSearchFilter, OrderingFilter]
     permission_classes = [IsOwnerOrStaffOrReadOnly]
+    pagination_class = BookCursorPagination
     filter_fields = ['price']
     search_fields = ['name', 'author_name']
     ordering_fields = ['author_name', 'price']
+    readers_limit_max = 50
+    expandable_fields = ['readers']
+    sparse_actions = ['list', 'retrieve', 'export', 'feed']
+    # Ranked feeds, each served by a (field, id) index on a counter the relation write paths keep up to date.
+    feeds = {'top_rated': 'rating', 'most_liked': 'likes_count', 'most_bookmarked': 'bookmarks_count'}
+    export_chunk_size = 2000
+    bulk_max_items = 1000
+
+    def get_readers_limit(self):
+        readers_limit = self.request.query_params.get('readers_limit')
+        if readers_limit is None:
+            return None
+        # isdigit() accepts superscripts like '²', which int() rejects.
+        if not readers_limit.isdecimal():
+            raise ValidationError({'readers_limit': 'A non-negative integer is required.'})
+        return min(int(readers_limit), self.readers_limit_max)
+
+    def get_book_fields(self):
+        """Return the BookSerializer fields picked by ?fields= and ?expand=, or None for all of them."""
+        if self.action not in self.sparse_actions:
+            return None
+        params = self.request.query_params
+        fields = {field.strip() for field in params.get('fields', '').split(',') if field.strip()}
+        expand = {field.strip() for field in params.get('expand', '').split(',') if field.strip()}
+        unknown = fields - set(BookSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError({'fields': f'Unknown fields: {", ".join(sorted(unknown))}.'})
+        unknown = expand - set(self.expandable_fields)
+        if unknown:
+            raise ValidationError({'expand': f'Unknown fields: {", ".join(sorted(unknown))}.'})
+        if 'fields' not in params:
+            return None
+        return tuple(field for field in BookSerializer.Meta.fields if field in fields or field in expand)
+
+    def get_book_columns(self, fields):
+        # Ordering fields are read by the cursor pagination, so they are loaded even when not requested.
+        if self.action == 'feed':
+            ordering = [self.feeds[self.kwargs['feed']]]
+        else:
+            ordering = OrderingFilter().get_ordering(self.request, self.queryset, self) or []
+        model_fields = {field.name for field in Book._meta.concrete_fields}
+        return ['id', *(field for field in fields if field in model_fields and field != 'id'),
+                *(field.lstrip('-') for field in ordering if field.lstrip('-') not in fields)]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if getattr(settings, 'STORE_OWNER_SCOPED_WRITES', False):
+            queryset = IsOwnerOrStaffOrReadOnly.scope_queryset(self.request, queryset)
+        if self.action == 'destroy':
+            # Nothing is serialized, the permission check only needs owner_id.
+            return queryset.only('id', 'owner_id', 'author_key')
+        if self.action == 'bulk':
+            # Bulk writes check owners and apply their items on the rows of this one query.
+            return queryset.only('id', 'owner_id', *BOOK_BULK_UPDATE_FIELDS)
+        fields = self.get_book_fields()
+        if fields is not None:
+            queryset = queryset.only(*self.get_book_columns(fields))
+        if fields is None or 'owner_name' in fields:
+            queryset = queryset.annotate(owner_name=F('owner__username'))
+        if fields is None or set(fields) & set(BOOK_USER_RELATION_FIELDS):
+            queryset = self.annotate_user_relation(queryset)
+        # UpdateModelMixin drops prefetched objects after saving, so updates load the readers for their response.
+        if (fields is None or 'readers' in fields) and self.action not in ('update', 'partial_update'):
+            readers_limit = self.get_readers_limit()
+            if readers_limit is None:
+                readers = Prefetch('readers', queryset=User.objects.order_by('id'))
+            else:
+                readers = Prefetch('readers', queryset=User.objects.order_by('id')[:readers_limit],
+                                   to_attr='sampled_readers')
+            queryset = queryset.prefetch_related(readers)
+        return queryset
+
+    def annotate_user_relation(self, queryset):
+        """Annotate the requesting user's like, in_bookmarks and rate with one LEFT JOIN on their relation."""
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(my_like=Value(False), my_in_bookmarks=Value(False),
+                                     my_rate=Value(None, output_field=IntegerField()))
+        return queryset.annotate(
+            my_relation=FilteredRelation('userbookrelation', condition=Q(userbookrelation__user=user)),
+        ).annotate(
+            my_like=Coalesce(F('my_relation__like'), False),
+            my_in_bookmarks=Coalesce(F('my_relation__in_bookmarks'), False),
+            my_rate=F('my_relation__rate'),
+        )
+
+    def get_values_queryset(self, queryset):
+        fields = self.get_book_fields()
+        if fields is None:
+            return queryset.prefetch_related(None).values(*BOOK_VALUES_FIELDS)
+        annotations = [field for field in ('owner_name', *BOOK_USER_RELATION_FIELDS) if field in fields]
+        return queryset.prefetch_related(None).values(*self.get_book_columns(fields), *annotations)
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.sparse_actions:
+            kwargs.setdefault('fields', self.get_book_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        view_method = self.fast_list if getattr(settings, 'STORE_FAST_BOOK_LIST', False) else super().list
+        return cached_response(book_list_cache_key(request), lambda: book_list_validators(request), view_method,
+                               request, *args, **kwargs)
+
+    def fast_list(self, request, *args, **kwargs):
+        queryset = self.get_values_queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset) if page is None else page
+        with serialization_timer(request):
+            data = book_values_data(rows, self.get_readers_limit(), self.get_book_fields())
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(book_cache_key(request, kwargs['pk']), lambda: book_validators(request, kwargs['pk']),
+                               super().retrieve, request, *args, **kwargs)
+
+    @action(detail=True, filter_backends=[], pagination_class=ReaderCursorPagination)
+    def readers(self, request, pk=None):
+        book = get_object_or_404(Book.objects.only('id'), pk=pk)
+        page = self.paginate_queryset(book.readers.order_by('id'))
+        serializer = BookReaderSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, url_path=r'feed/(?P<feed>top_rated|most_liked|most_bookmarked)', filter_backends=[],
+            pagination_class=FeedPagination)
+    def feed(self, request, feed):
+        cache = get_cache()
+        key = book_list_cache_key(request)
+        data = cache.get(key)
+        if data is None:
+            self.feed_field = self.feeds[feed]
+            queryset = self.get_values_queryset(self.get_queryset()).filter(**{f'{self.feed_field}__isnull': False})
+            page = self.paginate_queryset(queryset)
+            with serialization_timer(request):
+                data = self.get_paginated_response(
+                    book_values_data(page, self.get_readers_limit(), self.get_book_fields())).data
+            cache.set(key, data, getattr(settings, 'STORE_CACHE_TIMEOUT', 60))
+        return Response(data)
+
+    @action(detail=False, pagination_class=None)
+    def export(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        lines, content_type = self.get_export(output)
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="books.{output}"'
+        return response
+
+    def get_export(self, output):
+        """Return the lines and content type exporting the filtered, searched and ordered books as output."""
+        if output not in EXPORT_FORMATS:
+            raise ValidationError({'output': f'Expected one of: {", ".join(EXPORT_FORMATS)}.'})
+        fields = self.get_book_fields() or BOOK_VALUES_FIELDS
+        if 'readers' in fields:
+            raise ValidationError({'fields': 'Readers can not be exported.'})
+        queryset = self.get_values_queryset(self.filter_queryset(self.get_queryset()))
+        return export_lines(queryset, fields, output, self.export_chunk_size), EXPORT_FORMATS[output]
 
     def perform_create(self, serializer):
         serializer.validated_data['owner'] = self.request.user
         serializer.save()
 
+    @action(detail=False, methods=['post', 'put', 'patch', 'delete'], permission_classes=[IsAuthenticated])
+    def bulk(self, request):
+        """
+        Create (POST), update (PUT/PATCH, each item with its id) or delete (DELETE, a list of ids) many books in one
+        transaction. Nothing is written unless every item is valid, errors are a list aligned with the items.
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        if len(request.data) > self.bulk_max_items:
+            raise ValidationError({'non_field_errors': [f'Ensure there are no more than {self.bulk_max_items} items.']})
+        if request.method == 'POST':
+            serializer = BookSerializer(data=request.data, many=True)
+            serializer.is_valid(raise_exception=True)
+            books = bulk_create_books(request.user, serializer.validated_data)
+            return Response(BookSerializer(books, many=True, fields=BOOK_BULK_FIELDS).data,
+                            status=status.HTTP_201_CREATED)
+        with transaction.atomic():
+            if request.method == 'DELETE':
+                ids, errors = book_bulk_ids(request.data)
+            else:
+                ids, errors = book_bulk_ids([item.get('id', empty) if isinstance(item, dict) else empty
+                                             for item in request.data])
+            books = {book.id: book for book in
+                     self.get_queryset().filter(id__in={book_id for book_id in ids if book_id}).select_for_update()}
+            for book_id, item_errors in zip(ids, errors):
+                if book_id is None:
+                    continue
+                if book_id not in books:
+                    item_errors['id'] = ['Book does not exist.']
+                elif not (request.user.is_staff or books[book_id].owner_id == request.user.pk):
+                    item_errors['id'] = ['You do not have permission to change this book.']
+            if request.method == 'DELETE':
+                if any(errors):
+                    raise ValidationError(errors)
+                bulk_delete_books([books[book_id] for book_id in ids])
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            serializer = BookSerializer(data=request.data, many=True, partial=request.method == 'PATCH')
+            if not serializer.is_valid():
+                errors = [{**item_errors, **serializer_errors}
+                          for item_errors, serializer_errors in zip(errors, serializer.errors)]
+            if any(errors):
+                raise ValidationError(errors)
+            books = bulk_update_books([books[book_id] for book_id in ids], serializer.validated_data)
+        return Response(BookSerializer(books, many=True, fields=BOOK_BULK_FIELDS).data)
+
 
 class UserBookRelationView(UpdateModelMixin, GenericViewSet):
     permission_classes = [IsAuthenticated]
     queryset = UserBookRelation.objects.all()
     serializer_class = UserBookRelationSerializer
     lookup_field = 'book'
+    lookup_value_regex = r'\d+'
+    bulk_max_items = 1000
+
+    def update(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, partial=kwargs.get('partial', False))
+        serializer.is_valid(raise_exception=True)
+        serializer.validated_data.pop('book', None)
+        try:
+            relation = upsert_relation(request.user, int(self.kwargs['book']), serializer.validated_data)
+        except Book.DoesNotExist:
+            raise NotFound()
+        return Response(self.get_serializer(relation).data)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        if len(request.data) > self.bulk_max_items:
+            raise ValidationError({'non_field_errors': [f'Ensure there are no more than {self.bulk_max_items} items.']})
+        results = []
+        items = []
+        for item in request.data:
+            serializer = UserBookRelationBulkSerializer(data=item)
+            if serializer.is_valid():
+                results.append({'book': serializer.validated_data['book'], 'status': 'ok'})
+                items.append(serializer.validated_data)
+            else:
+                results.append({'book': item.get('book') if isinstance(item, dict) else None,
+                                'status': 'error', 'errors': serializer.errors})
+        existing_books = set(Book.objects.filter(id__in={item['book'] for item in items}).values_list('id', flat=True))
+        for result in results:
+            if result['status'] == 'ok' and result['book'] not in existing_books:
+                result.update(status='error', errors={'book': ['Book does not exist.']})
+        items = [item for item in items if item['book'] in existing_books]
+        if items:
+            bulk_update_relations(request.user, items)
+        return Response(results)
 
-    def get_object(self):
-        obj, _ = UserBookRelation.objects.get_or_create(user=self.request.user, book_id=self.kwargs['book'])
-        return obj
+
+class AuthorStatsViewSet(ReadOnlyModelViewSet):
+    queryset = AuthorStats.objects.annotate(
+        average_price=Cast(F('price_sum'), FloatField()) / NullIf(F('books_count'), 0),
+        average_rating=Cast(F('rating_sum'), FloatField()) / NullIf(F('ratings_count'), 0),
+    ).order_by('author_key')
+    serializer_class = AuthorStatsSerializer
+    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filterset_fields = {
+        'books_count': ['exact', 'gte', 'lte'],
+        'likes_count': ['gte', 'lte'],
+        'ratings_count': ['gte', 'lte'],
+    }
+    search_fields = ['author_name']
+    ordering_fields = ['author_name', 'books_count', 'average_price', 'average_rating', 'likes_count',
+                       'ratings_count']
+    pagination_class = AuthorStatsPagination
 
 
 def auth(request):